@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# STM32 system memory USART bootloader (ST AN3155) driven over
+# YAPLC connector transport, replaces external stm32flash runs.
+
+import exceptions
+import os
+import shutil
+import hashlib
+import tempfile
+import zlib
+
+BOOT_SYNC = "\x7f"
+BOOT_ACK = "\x79"
+BOOT_NACK = "\x1f"
+
+BOOT_GET = 0x00
+BOOT_GET_ID = 0x02
+BOOT_READ = 0x11
+BOOT_GO = 0x21
+BOOT_WRITE = 0x31
+BOOT_ERASE = 0x43
+BOOT_EXTENDED_ERASE = 0x44
+
+# bootloader detects baud rate on sync byte, 115200 is the fastest it takes
+BOOT_BAUD = 115200
+BOOT_MODE = "8E1"
+# stm32flash speed if no -b is given
+STM32FLASH_BAUD = 57600
+# biggest read/write block
+BOOT_BLOCK = 256
+
+FLASH_BASE = 0x08000000
+
+
+class YAPLCBootError(exceptions.Exception):
+        """Exception class"""
+        def __init__(self, msg):
+                self.msg = msg
+
+        def __str__(self):
+                return "Exception in YAPLC bootloader : " + str(self.msg)
+
+
+def _Sectors(sizes, base = FLASH_BASE):
+    pages = []
+    for size in sizes:
+        pages.append((base, size))
+        base += size
+    return pages
+
+
+def _Pages(count, size):
+    return _Sectors([size] * count)
+
+
+_F4_SECTORS = [0x4000] * 4 + [0x10000] + [0x20000] * 7
+
+# flash pages (start, size) of devices by bootloader product id,
+# page number in erase command is index in this list
+FLASH_LAYOUTS = {0x412: _Pages(32, 0x400),     # F1 low density
+                 0x410: _Pages(128, 0x400),    # F1 medium density
+                 0x414: _Pages(256, 0x800),    # F1 high density
+                 0x418: _Pages(128, 0x800),    # F1 connectivity line
+                 0x420: _Pages(128, 0x400),    # F1 value line
+                 0x428: _Pages(256, 0x800),    # F1 high density value line
+                 0x430: _Pages(512, 0x800),    # F1 XL density
+                 0x411: _Sectors(_F4_SECTORS), # F2
+                 0x413: _Sectors(_F4_SECTORS), # F405/F407/F415/F417
+                 0x419: _Sectors(_F4_SECTORS * 2), # F42x/F43x
+                 0x423: _Sectors(_F4_SECTORS[:6]), # F401xB/C
+                 0x433: _Sectors(_F4_SECTORS[:8]), # F401xD/E
+                 0x431: _Sectors(_F4_SECTORS[:8])} # F411
+
+
+def ReadIntelHex(path):
+    """
+    Read Intel HEX file, returns sorted list of (address, bytearray)
+    of contiguous data
+    """
+    memory = {}
+    base = 0
+    try:
+        hexfile = open(path, "r")
+    except IOError, e:
+        raise YAPLCBootError("Couldn't open " + path + ": " + str(e))
+    try:
+        for number, line in enumerate(hexfile, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                if line[0] != ":":
+                    raise ValueError
+                record = bytearray(line[1:].decode("hex"))
+            except (ValueError, TypeError):
+                raise YAPLCBootError("%s:%d: not a HEX record" % (path, number))
+            if len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xff:
+                raise YAPLCBootError("%s:%d: broken HEX record" % (path, number))
+            length, kind = record[0], record[3]
+            offset = (record[1] << 8) | record[2]
+            data = record[4:4 + length]
+            if kind == 0x00:
+                memory[base + offset] = data
+            elif kind == 0x01:
+                break
+            elif kind == 0x02:
+                base = ((data[0] << 8) | data[1]) << 4
+            elif kind == 0x04:
+                base = ((data[0] << 8) | data[1]) << 16
+    finally:
+        hexfile.close()
+
+    segments = []
+    for address in sorted(memory):
+        data = memory[address]
+        if segments and segments[-1][0] + len(segments[-1][1]) == address:
+            segments[-1][1].extend(data)
+        else:
+            segments.append((address, bytearray(data)))
+    return segments
+
+
+def ClipSegments(segments, start, size):
+    """
+    Return parts of segments inside [start, start + size)
+    """
+    clipped = []
+    for address, data in segments:
+        first = max(address, start)
+        last = min(address + len(data), start + size)
+        if first < last:
+            clipped.append((first, data[first - address:last - address]))
+    return clipped
+
+
+class YAPLCImageCache:
+    """
+    Last image flashed to every device, keyed by PLC id string.
+    Images are kept as HEX files in directory.
+    """
+    def __init__(self, directory = None):
+        if directory is None:
+            directory = os.environ.get("YAPLC_IMAGE_CACHE",
+                                       os.path.join(os.path.expanduser("~"), ".yaplc", "images"))
+        self.directory = directory
+
+    def _Path(self, plcid):
+        return os.path.join(self.directory, hashlib.sha1(plcid).hexdigest() + ".hex")
+
+    def Get(self, plcid):
+        """
+        Return segments of image flashed to device plcid, None if unknown
+        """
+        if not plcid:
+            return None
+        path = self._Path(plcid)
+        if not os.path.isfile(path):
+            return None
+        try:
+            return ReadIntelHex(path)
+        except YAPLCBootError:
+            return None
+
+    def Put(self, plcid, path):
+        if not plcid:
+            return
+        target = self._Path(plcid)
+        temp = None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # readers see old or new image, never a part of one
+            fd, temp = tempfile.mkstemp(".hex", "", self.directory)
+            os.close(fd)
+            shutil.copyfile(path, temp)
+            if os.name in ("nt", "ce") and os.path.exists(target):
+                os.remove(target)
+            os.rename(temp, target)
+        except (IOError, OSError):
+            # no cache next time, full upload is still fine
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
+
+
+def ParseFlashCommand(command):
+    """
+    Take image and addresses from stm32flash command line as made by
+    toolchain_yaplc_stm32.GetBinaryCode. Returns dict with "image",
+    "verify" and "go" or None if command is something else.
+    Like stm32flash, go address 0 means start of device flash,
+    where bootloader of RTE lives, not start of written image.
+    """
+    if not command or not os.path.basename(command[0]).startswith("stm32flash"):
+        return None
+    args = {"image": None, "verify": False, "go": None}
+    tokens = iter(command[1:])
+    try:
+        for token in tokens:
+            if token == "-w":
+                args["image"] = tokens.next()
+            elif token == "-v":
+                args["verify"] = True
+            elif token == "-g":
+                args["go"] = int(tokens.next(), 0)
+            elif token == "-S":
+                # image HEX file carries its own addresses
+                tokens.next()
+    except (StopIteration, ValueError):
+        return None
+    if args["image"] is None or not args["image"].lower().endswith(".hex"):
+        return None
+    if args["go"] == 0:
+        # bootloader takes only addresses in flash or RAM
+        args["go"] = FLASH_BASE
+    return args
+
+
+def FlasherBaud(command):
+    """
+    Baud rate stm32flash command line talks to bootloader with
+    """
+    for token, value in zip(command, command[1:]):
+        if token == "-b":
+            try:
+                return int(value)
+            except ValueError:
+                break
+    return STM32FLASH_BAUD
+
+
+class YAPLCStm32Boot:
+    """
+    Bootloader session on an open transport, timeouts are in transport units.
+    progress is called with (done, total) bytes while flashing.
+    """
+    def __init__(self, SerialPort, timeout, progress = None):
+        self.SerialPort = SerialPort
+        self.timeout = timeout
+        self.progress = progress
+        self.Version = None
+        self.Commands = []
+        self.ProductId = None
+
+    def _Read(self, nbytes):
+        data = self.SerialPort.Read(nbytes)
+        if data is None:
+            raise YAPLCBootError("bootloader did not answer!")
+        return data
+
+    def _WaitAck(self, what):
+        answer = self._Read(1)
+        if answer == BOOT_NACK:
+            raise YAPLCBootError(what + " refused!")
+        if answer != BOOT_ACK:
+            raise YAPLCBootError(what + " got unexpected answer 0x%02x!" % ord(answer))
+
+    def _Checked(self, data):
+        data = bytearray(data)
+        checksum = 0
+        for byte in data:
+            checksum ^= byte
+        data.append(checksum)
+        return data
+
+    def _Command(self, command):
+        self.SerialPort.Write(chr(command) + chr(command ^ 0xff))
+        self._WaitAck("command 0x%02x" % command)
+
+    def _Address(self, address):
+        self.SerialPort.WriteFrom(self._Checked([(address >> 24) & 0xff, (address >> 16) & 0xff,
+                                                 (address >> 8) & 0xff, address & 0xff]))
+        self._WaitAck("address 0x%08x" % address)
+
+    def Sync(self):
+        """
+        Send sync byte once, returns True if bootloader answered
+        """
+        self.SerialPort.Write(BOOT_SYNC)
+        answer = self.SerialPort.Read(1)
+        # NACK comes from bootloader that was synced before
+        return answer in (BOOT_ACK, BOOT_NACK)
+
+    def Connect(self):
+        """
+        Read bootloader version, commands and product id
+        """
+        self._Command(BOOT_GET)
+        count = ord(self._Read(1)) + 1
+        data = self._Read(count)
+        self._WaitAck("GET")
+        self.Version = ord(data[0])
+        self.Commands = map(ord, data[1:])
+        self._Command(BOOT_GET_ID)
+        count = ord(self._Read(1)) + 1
+        data = self._Read(count)
+        self._WaitAck("GET ID")
+        self.ProductId = (ord(data[0]) << 8) | ord(data[-1])
+
+    def Pages(self):
+        layout = FLASH_LAYOUTS.get(self.ProductId)
+        if layout is None:
+            raise YAPLCBootError("unknown device 0x%03x!" % (self.ProductId or 0))
+        return layout
+
+    def PagesOf(self, segments):
+        """
+        Return numbers of flash pages segments touch
+        """
+        numbers = []
+        for number, (start, size) in enumerate(self.Pages()):
+            if ClipSegments(segments, start, size):
+                numbers.append(number)
+        return numbers
+
+    def _PageImage(self, segments, start, size):
+        # page content after erase and write of segments
+        page = bytearray("\xff" * size)
+        for address, data in ClipSegments(segments, start, size):
+            page[address - start:address - start + len(data)] = data
+        return page
+
+    def PagesSegments(self, segments, pages):
+        """
+        Return parts of segments inside given pages
+        """
+        layout = self.Pages()
+        clipped = []
+        for number in pages:
+            clipped.extend(ClipSegments(segments, *layout[number]))
+        return clipped
+
+    def ChangedPages(self, old, segments):
+        """
+        Return numbers of pages segments touch whose content differs
+        from old image
+        """
+        layout = self.Pages()
+        return [number for number in self.PagesOf(segments)
+                if self._PageImage(old, *layout[number]) !=
+                   self._PageImage(segments, *layout[number])]
+
+    def Erase(self, numbers):
+        if not numbers:
+            return
+        if BOOT_EXTENDED_ERASE in self.Commands:
+            self._Command(BOOT_EXTENDED_ERASE)
+            request = [(len(numbers) - 1) >> 8, (len(numbers) - 1) & 0xff]
+            for number in numbers:
+                request += [number >> 8, number & 0xff]
+        else:
+            if max(numbers) > 0xff or len(numbers) > 0xff:
+                raise YAPLCBootError("too many pages for ERASE!")
+            self._Command(BOOT_ERASE)
+            request = [len(numbers) - 1] + numbers
+        self.SerialPort.WriteFrom(self._Checked(request))
+        # every page takes its time, sectors of F4 up to seconds
+        self.SerialPort.SetTimeout(self.timeout * max(len(numbers), 1))
+        try:
+            self._WaitAck("ERASE")
+        finally:
+            self.SerialPort.SetTimeout(self.timeout)
+
+    def _Blocks(self, segments):
+        for address, data in segments:
+            for offset in xrange(0, len(data), BOOT_BLOCK):
+                yield address + offset, data[offset:offset + BOOT_BLOCK]
+
+    def Write(self, segments):
+        total = sum([len(data) for address, data in segments])
+        done = 0
+        for address, block in self._Blocks(segments):
+            # flash is written in words, tail is padded with erased value
+            block = block + "\xff" * (-len(block) % 4)
+            self._Command(BOOT_WRITE)
+            self._Address(address)
+            self.SerialPort.WriteFrom(self._Checked(chr(len(block) - 1) + block))
+            self._WaitAck("WRITE at 0x%08x" % address)
+            done += len(block)
+            if self.progress is not None:
+                self.progress(min(done, total), total)
+
+    def Read(self, address, nbytes):
+        data = bytearray()
+        while nbytes > 0:
+            count = min(nbytes, BOOT_BLOCK)
+            self._Command(BOOT_READ)
+            self._Address(address)
+            self.SerialPort.Write(chr(count - 1) + chr((count - 1) ^ 0xff))
+            self._WaitAck("READ at 0x%08x" % address)
+            data.extend(self._Read(count))
+            address += count
+            nbytes -= count
+        return data
+
+    def Matches(self, segments):
+        """
+        Read segments back, True if CRC32 of every one is as expected
+        """
+        for address, data in segments:
+            if zlib.crc32(str(self.Read(address, len(data)))) != zlib.crc32(str(data)):
+                return False
+        return True
+
+    def Verify(self, segments):
+        for address, data in segments:
+            if not self.Matches([(address, data)]):
+                raise YAPLCBootError("checksum mismatch in segment at 0x%08x!" % address)
+
+    def Go(self, address):
+        self._Command(BOOT_GO)
+        self._Address(address)
+
+    def Flash(self, segments, verify = True, go = None, pages = None):
+        """
+        Erase pages under image, write and verify it, start it at go.
+        pages limits erase, write and verify to these page numbers,
+        rest of image must be checked with Matches by caller.
+        """
+        if pages is None:
+            pages = self.PagesOf(segments)
+        written = self.PagesSegments(segments, pages)
+        self.Erase(pages)
+        self.Write(written)
+        if verify:
+            self.Verify(written)
+        if go is not None:
+            self.Go(go)
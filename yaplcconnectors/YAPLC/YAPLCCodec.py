@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Binary layouts of YAPLC protocol fields.
+# Controllers are little-endian Cortex-M parts, all layouts say so
+# explicitly instead of relying on host byte order.
+
+import struct
+
+U8 = struct.Struct("<B")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+
+# reply data length
+LENGTH = U32
+# tick that starts trace sample
+TRACE_TICK = U32
+# GET_TRACE_SAMPLES entry header: tick, sample size
+SAMPLE_HEADER = struct.Struct("<II")
+# GET_LOGMSG request: level, message index
+LOGMSG_REQUEST = struct.Struct("<Bi")
+# GET_LOGMSG reply header: tick, tv_sec, tv_nsec
+LOGMSG_HEADER = struct.Struct("<III")
+# GET_LOGMSG_RANGE request: level, first message index, index after last one
+LOGMSG_RANGE_REQUEST = struct.Struct("<BII")
+# SETRTC: year % 100, month, day, hour, minute, second
+RTC = struct.Struct("<6B")
+# GET_CAPS reply header: protocol version, biggest request frame payload,
+# bitmap of supported commands, supported baud rates follow as uint32
+CAPS_HEADER = struct.Struct("<HHI")
+# SET_TRACE_CHUNK header: chunk offset, whole list size, chunk size
+CHUNK_HEADER = struct.Struct("<IIH")
+# frame header: sequence number, payload length
+FRAME_HEADER = struct.Struct("<BH")
+FRAME_CRC = U16
+# trace data pushed by RTE in streaming mode: PLC status, data length
+PUSH_HEADER = struct.Struct("<BI")
+# trace recording file header: magic, format version, record size,
+# variable count, record count, variables follow as RECORDING_VARIABLE
+RECORDING_HEADER = struct.Struct("<8sIIII")
+# recorded variable: idx, IEC type name
+RECORDING_VARIABLE = struct.Struct("<I12s")
+# trace recording record header: tick extended to 64 bits, sample size
+RECORD_HEADER = struct.Struct("<QI")
+
+_U32Arrays = {}
+
+
+def LengthPrefixed(data):
+    """
+    data preceded by its LENGTH, in one new bytearray
+    """
+    packed = bytearray(LENGTH.size + len(data))
+    LENGTH.pack_into(packed, 0, len(data))
+    packed[LENGTH.size:] = data
+    return packed
+
+
+def U32Array(count):
+    """
+    Cached layout of count consecutive uint32 values
+    """
+    layout = _U32Arrays.get(count)
+    if layout is None:
+        layout = _U32Arrays[count] = struct.Struct("<%dI" % count)
+    return layout
+
+
+# Size of IEC types in debug buffer as laid out by target,
+# STRING takes its length byte plus length bytes, so it has no fixed size.
+# TIME and date types are two 32 bit longs on target.
+IEC_TYPE_SIZES = {"BOOL":  1, "STEP": 1, "TRANSITION": 1, "ACTION": 1,
+                  "SINT":  1, "USINT": 1, "BYTE": 1,
+                  "INT":   2, "UINT":  2, "WORD": 2,
+                  "DINT":  4, "UDINT": 4, "DWORD": 4, "REAL": 4,
+                  "LINT":  8, "ULINT": 8, "LWORD": 8, "LREAL": 8,
+                  "TIME":  8, "TOD":   8, "DATE":  8, "DT":   8,
+                  "STRING": None}
+
+# STRING in debug buffer at most: length byte and STR_MAXLEN characters
+IEC_STRING_MAX_SIZE = 1 + 126
+
+
+# Layout of forced values of fixed size IEC types that need no conversion,
+# other types are packed by connector with TypeTranslator
+IEC_FORCE_LAYOUTS = dict([(iectype, struct.Struct(fmt)) for iectype, fmt in [
+    ("BOOL", "<?"), ("STEP", "<B"), ("TRANSITION", "<B"), ("ACTION", "<B"),
+    ("SINT", "<b"), ("USINT", "<B"), ("BYTE", "<B"),
+    ("INT",  "<h"), ("UINT",  "<H"), ("WORD", "<H"),
+    ("DINT", "<i"), ("UDINT", "<I"), ("DWORD", "<I"), ("REAL", "<f"),
+    ("LINT", "<q"), ("ULINT", "<Q"), ("LWORD", "<Q"), ("LREAL", "<d")]])
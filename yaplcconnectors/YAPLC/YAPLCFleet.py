@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Many YAPLC PLCs driven at once. Every PLC has its own YAPLCObject
+# on its own serial port, fleet calls run on all of them in parallel.
+
+from multiprocessing.pool import ThreadPool
+
+from YAPLCObject import YAPLCObject
+from YAPLCTransport import DefaultTransport, LibraryFile
+
+
+class YAPLCFleetLogger:
+    """
+    Logger prefixing messages with name of PLC they come from
+    """
+    def __init__(self, logger, name):
+        self.logger = logger
+        self.prefix = name + ": "
+
+    def write(self, v):
+        self.logger.write(self.prefix + v)
+
+    def write_warning(self, v):
+        self.logger.write_warning(self.prefix + v)
+
+    def write_error(self, v):
+        self.logger.write_error(self.prefix + v)
+
+    def writeyield(self, v):
+        self.logger.writeyield(self.prefix + v)
+
+    def __getattr__(self, name):
+        return getattr(self.logger, name)
+
+
+class YAPLCFleetRoot:
+    """
+    confnodesroot of one fleet PLC, only logger differs
+    """
+    def __init__(self, confnodesroot, name):
+        self.confnodesroot = confnodesroot
+        self.logger = YAPLCFleetLogger(confnodesroot.logger, name)
+
+    def __getattr__(self, name):
+        return getattr(self.confnodesroot, name)
+
+
+class YAPLCFleet:
+    """
+    PLCs on serial ports, opened concurrently on creation.
+    Fleet methods call same YAPLCObject method on every connected PLC
+    at once and return dict of results by every port, failed calls and
+    PLCs not connected give None and leave their error in Failures.
+    """
+    def __init__(self, ports, confnodesroot, transport = None, workers = None):
+        if transport is None:
+            transport = DefaultTransport()
+        self.transport = transport
+        self.libfile = LibraryFile(transport)
+        self.confnodesroot = confnodesroot
+        self.Ports = list(ports)
+        self.Failures = {}
+        # serial work waits for PLCs, not for CPU: a thread per PLC
+        self._Pool = ThreadPool(workers or max(len(self.Ports), 1))
+        self.PLCs = self._Map(self._Open, self.Ports)
+        self._MarkDisconnected()
+
+    def _Open(self, port):
+        return YAPLCObject(self.libfile, YAPLCFleetRoot(self.confnodesroot, port), port, self.transport)
+
+    def _Map(self, function, ports):
+        def call(port):
+            try:
+                return port, function(port), None
+            except Exception, e:
+                return port, None, str(e)
+
+        self.Failures = {}
+        results = {}
+        for port, res, failure in self._Pool.map(call, ports):
+            results[port] = res
+            if failure is not None:
+                self.Failures[port] = failure
+                self.confnodesroot.logger.write_error(port + ": " + failure + "\n")
+        return results
+
+    def _MarkDisconnected(self):
+        """
+        Record failure of every PLC without connection, returns their ports
+        """
+        connected = self.Connected()
+        ports = [port for port in self.Ports if port not in connected]
+        for port in ports:
+            # error of failed open is kept
+            self.Failures.setdefault(port, "not connected")
+        return ports
+
+    def _Call(self, method, *args):
+        results = self._Map(lambda port: getattr(self.PLCs[port], method)(*args), self.Connected())
+        for port in self._MarkDisconnected():
+            results[port] = None
+        return results
+
+    def Connected(self):
+        """
+        Return ports of PLCs with open connection
+        """
+        return [port for port in self.Ports
+                if self.PLCs.get(port) is not None and self.PLCs[port].SerialConnection is not None]
+
+    def MatchMD5(self, MD5):
+        return self._Call("MatchMD5", MD5)
+
+    def NewPLC(self, md5sum, data, extrafiles):
+        """
+        Load program on every PLC not running it yet
+        """
+        return self._Call("NewPLC", md5sum, data, extrafiles)
+
+    def StartPLC(self):
+        return self._Call("StartPLC")
+
+    def StopPLC(self):
+        return self._Call("StopPLC")
+
+    def GetPLCstatus(self):
+        return self._Call("GetPLCstatus")
+
+    def GetStatusSnapshots(self):
+        """
+        Return latest YAPLCStatus of every PLC, never blocks
+        """
+        return dict([(port, plc.GetStatusSnapshot())
+                     for port, plc in self.PLCs.items() if plc is not None])
+
+    def Close(self):
+        self._Map(lambda port: self.PLCs[port].Disconnect(),
+                  [port for port in self.Ports if self.PLCs.get(port) is not None])
+        self._Pool.close()
+        self._Pool.join()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Optional framing layer of YAPLC protocol.
+#
+# Frame: SYNC, SEQ, LEN (2 bytes LE), PAYLOAD, CRC16 (2 bytes LE)
+# CRC16-CCITT (poly 0x1021, init 0xFFFF) covers SEQ, LEN and PAYLOAD.
+#
+# Request payload is command byte followed by command data,
+# reply payload is command ack followed by reply data.
+# Empty request frame is a NAK: RTE sends its reply for SEQ again.
+# Request with SEQ at most FRAME_REPEAT_WINDOW - 1 behind newest SEQ
+# RTE got (or equal to it) is a repeat and is not executed again,
+# RTE answers with reply it has sent for SEQ before. Older SEQ comes
+# again after wrap and is a new request. Host never has more than
+# FRAME_REPEAT_WINDOW requests on the wire. FRAMING ack starts with
+# no SEQ seen.
+# LEN is never above MaxFrame RTE reported with GET_CAPS, both ways.
+# SEQ 0xFF is never used by requests, RTE sends data it pushes on its own
+# (streamed trace) with it, payload is PLC status followed by data.
+
+import exceptions
+
+from YAPLCCodec import FRAME_HEADER, FRAME_CRC
+
+FRAME_SYNC = "\x7e"
+# biggest payload accepted, longer length field means a corrupted header
+FRAME_MAX_PAYLOAD = 0xfff0
+# bytes frame adds to payload
+FRAME_OVERHEAD = 1 + FRAME_HEADER.size + FRAME_CRC.size
+# sequence number of frames RTE sends without request
+FRAME_PUSH_SEQ = 0xff
+# requests sent last that may come again as retries
+FRAME_REPEAT_WINDOW = 16
+
+
+class YAPLCFrameError(exceptions.Exception):
+        """Exception class"""
+        def __init__(self, msg):
+                self.msg = msg
+
+        def __str__(self):
+                return "Exception in YAPLC framing : " + str(self.msg)
+
+
+def _MakeCrcTable():
+    table = []
+    for byte in xrange(256):
+        crc = byte << 8
+        for bit in xrange(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xffff
+            else:
+                crc = (crc << 1) & 0xffff
+        table.append(crc)
+    return table
+
+_CRC_TABLE = _MakeCrcTable()
+
+
+def Crc16(data, crc = 0xffff):
+    table = _CRC_TABLE
+    for byte in bytearray(data):
+        crc = ((crc << 8) & 0xffff) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def EncodeFrame(seq, payload):
+    length = len(payload)
+    frame = bytearray(1 + FRAME_HEADER.size + length + FRAME_CRC.size)
+    frame[0] = FRAME_SYNC
+    FRAME_HEADER.pack_into(frame, 1, seq, length)
+    frame[1 + FRAME_HEADER.size:-FRAME_CRC.size] = payload
+    FRAME_CRC.pack_into(frame, len(frame) - FRAME_CRC.size,
+                        Crc16(buffer(frame, 1, FRAME_HEADER.size + length)))
+    return frame
+
+
+def IsRepeatedSeq(seq, newest):
+    """
+    True if request seq repeats one sent before, newest is latest
+    request SEQ received, None if none yet
+    """
+    return newest is not None and (newest - seq) % FRAME_PUSH_SEQ < FRAME_REPEAT_WINDOW
+
+
+def ReadFrame(SerialPort, synced = False, maxlength = FRAME_MAX_PAYLOAD):
+    """
+    Read next frame, skipping anything before SYNC.
+    synced tells SYNC was already read by caller, longer LEN than
+    maxlength means corrupted header and is not waited for.
+    Returns (seq, payload) or None if nothing came in time,
+    raises YAPLCFrameError if frame is broken.
+    """
+    skipped = 0
+    while not synced:
+        byte = SerialPort.Read(1)
+        if byte is None:
+            if skipped:
+                raise YAPLCFrameError("no frame start after garbage!")
+            return None
+        if byte == FRAME_SYNC:
+            break
+        skipped += 1
+        if skipped > FRAME_MAX_PAYLOAD:
+            raise YAPLCFrameError("no frame start!")
+    header = SerialPort.Read(FRAME_HEADER.size)
+    if header is None:
+        raise YAPLCFrameError("truncated frame header!")
+    seq, length = FRAME_HEADER.unpack(header)
+    if length > maxlength:
+        raise YAPLCFrameError("bad frame length!")
+    body = SerialPort.Read(length + FRAME_CRC.size)
+    if body is None:
+        raise YAPLCFrameError("truncated frame!")
+    crc, = FRAME_CRC.unpack_from(body, length)
+    if crc != Crc16(buffer(body, 0, length), Crc16(header)):
+        raise YAPLCFrameError("frame CRC mismatch!")
+    return seq, body[:length]
+
+
+class YAPLCFrameReader:
+    """
+    Serial port look alike serving reads from a received frame payload,
+    transactions parse framed replies with it as usual.
+    """
+    def __init__(self, payload):
+        self.payload = payload
+        self.pos = 0
+
+    def Read(self, nbytes):
+        if self.pos + nbytes > len(self.payload):
+            return None
+        data = self.payload[self.pos:self.pos + nbytes]
+        self.pos += nbytes
+        return data
+
+    def ReadInto(self, buffer, nbytes, offset = 0):
+        if self.pos + nbytes > len(self.payload):
+            return None
+        buffer[offset:offset + nbytes] = self.payload[self.pos:self.pos + nbytes]
+        self.pos += nbytes
+        return nbytes
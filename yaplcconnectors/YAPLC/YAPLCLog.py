@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Host side helpers of YAPLC log message transfer
+
+from YAPLCCodec import *
+
+# messages asked for by one GET_LOGMSG_RANGE
+LOG_BATCH = 32
+
+
+def SplitLogMessage(data, offset = 0, size = None):
+    """
+    Decode GET_LOGMSG reply into (msg, tick, tv_sec, tv_nsec),
+    None if there is no message
+    """
+    if size is None:
+        size = len(data) - offset
+    if size <= LOGMSG_HEADER.size:
+        return None
+    msg = str(buffer(data, offset + LOGMSG_HEADER.size, size - LOGMSG_HEADER.size))
+    return (msg,) + LOGMSG_HEADER.unpack_from(data, offset)
+
+
+def SplitLogMessages(data):
+    """
+    Split GET_LOGMSG_RANGE reply, a sequence of size and GET_LOGMSG
+    reply entries, into list of messages.
+    Returns None if reply is truncated.
+    """
+    messages = []
+    offset = 0
+    while offset < len(data):
+        if offset + LENGTH.size > len(data):
+            return None
+        size, = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        if offset + size > len(data):
+            return None
+        messages.append(SplitLogMessage(data, offset, size))
+        offset += size
+    return messages
+
+
+class YAPLCLogCache:
+    """
+    Log messages already fetched from PLC, keyed by (PLC id, level, msgid).
+    Cursor keeps last index asked for every level, so batches are
+    fetched in the direction messages are read.
+    """
+    def __init__(self):
+        # log counts per level from last PLC status
+        self.Counts = {}
+        self.Reset(None)
+
+    def Reset(self, plcid):
+        self.PLCID = plcid
+        self.Messages = {}
+        self.Cursors = {}
+
+    def Clear(self):
+        """
+        Forget everything, logs were reset on target
+        """
+        self.Counts = {}
+        self.Reset(self.PLCID)
+
+    def SetPLCID(self, plcid):
+        if plcid != self.PLCID:
+            self.Reset(plcid)
+
+    def SetCounts(self, counts):
+        """
+        Take log counts from PLC status, shrinking count means
+        logs were cleared on target and cached level is stale
+        """
+        for level, count in enumerate(counts):
+            if count < self.Counts.get(level, 0):
+                self._DropLevel(level)
+            self.Counts[level] = count
+
+    def _DropLevel(self, level):
+        for key in [key for key in self.Messages if key[1] == level]:
+            del self.Messages[key]
+        self.Cursors.pop(level, None)
+
+    def Get(self, level, msgid):
+        return self.Messages.get((self.PLCID, level, msgid))
+
+    def Window(self, level, msgid):
+        """
+        Return (first, last) range of missing messages to fetch with msgid
+        """
+        count = self.Counts.get(level)
+        cursor = self.Cursors.get(level)
+        self.Cursors[level] = msgid
+        if cursor is None and count is not None:
+            # reading usually starts from newest message
+            cursor = count
+        if cursor is not None and msgid < cursor:
+            # reading backwards, newest messages first
+            first, last = max(msgid - LOG_BATCH + 1, 0), msgid + 1
+        else:
+            first, last = msgid, msgid + LOG_BATCH
+        if count is not None and msgid < count:
+            last = min(last, count)
+        while first < msgid and self.Get(level, first) is not None:
+            first += 1
+        while last > msgid + 1 and self.Get(level, last - 1) is not None:
+            last -= 1
+        return first, last
+
+    def Store(self, level, first, messages):
+        for msgid, message in enumerate(messages, first):
+            if message is not None:
+                self.Messages[(self.PLCID, level, msgid)] = message
@@ -13,24 +13,100 @@ if __name__ == "__main__":
     append_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
     sys.path.append(append_path)
 
-from threading import Lock
+from threading import Lock, Thread
 import ctypes
 from YAPLCProto import *
+from YAPLCCodec import *
+from YAPLCTrace import *
+from YAPLCLog import *
+from YAPLCScheduler import *
+from YAPLCBoot import *
+from YAPLCRecorder import *
 from targets.typemapping import LogLevelsCount, TypeTranslator, UnpackDebugBuffer
 from util.ProcessLogger import ProcessLogger
 
 import pdb
 
+# trace streaming period requested from RTE, ms
+YAPLC_STREAM_PERIOD = 50
+# stream reader wait for pushed data, s
+YAPLC_STREAM_WAIT = 0.05
+
+# time bootloader has to answer sync after BOOT, s
+YAPLC_BOOT_READY_TIMEOUT = 5.0
+
+# long operation phases reported in status snapshot
+YAPLC_PHASE_IDLE = "idle"
+YAPLC_PHASE_BOOTING = "booting"
+YAPLC_PHASE_UPLOADING = "uploading"
+YAPLC_PHASE_RECONNECTING = "reconnecting"
+
+
+class YAPLCStatus:
+    """
+    Status snapshot, never changed once published,
+    readers take YAPLCObject.Snapshot without locking
+    """
+    def __init__(self, State, LogCounts = None, Phase = YAPLC_PHASE_IDLE,
+                 Progress = None, Timestamp = None, Baud = None):
+        self.State = State
+        self.LogCounts = LogCounts
+        self.Phase = Phase
+        # part of long operation done, 0.0 to 1.0, None if unknown
+        self.Progress = Progress
+        self.Timestamp = time.time() if Timestamp is None else Timestamp
+        # negotiated serial link speed, None if not connected
+        self.Baud = Baud
+
+    def Replace(self, **changes):
+        fields = {"State": self.State, "LogCounts": self.LogCounts,
+                  "Phase": self.Phase, "Progress": self.Progress,
+                  "Baud": self.Baud}
+        fields.update(changes)
+        return YAPLCStatus(**fields)
+
+
 
 class YAPLCObject():
-    def __init__(self, libfile, confnodesroot, comportstr):
+    def __init__(self, libfile, confnodesroot, comportstr, transport=None):
 
         self.TransactionLock = Lock()
         self.PLCStatus = "Disconnected"
         self.libfile = libfile
+        self.transport = transport
         self.confnodesroot = confnodesroot
         self.PLCprint = confnodesroot.logger.writeyield
         self._Idxs = []
+        # RTE has _Idxs registered, changes may be sent as deltas
+        self._TraceListSynced = False
+        self._TraceBuffer = bytearray()
+        self._PrefetchBuffer = bytearray()
+        self._LogBuffer = bytearray()
+        # trace samples fetched along with status, not yet returned
+        self._TraceSamples = []
+        self._TraceSamplesLock = Lock()
+        # bumped on trace list change, samples of older layout are dropped
+        self._TraceGeneration = 0
+        # YAPLCTraceRecorder every stored sample goes to, None if not recording
+        self._Recorder = None
+        self._DeltaTrace = YAPLCDeltaTrace()
+        self._TraceDecoder = YAPLCTraceDecoder()
+        # YAPLCPackPlan of registered variables
+        self._PackPlan = None
+        self.TraceStreamPeriod = YAPLC_STREAM_PERIOD
+        self._StreamThread = None
+        # PLC id string as last read from PLC, None when unknown
+        self._PLCID = None
+        self._LogCache = YAPLCLogCache()
+        # capabilities RTE reported on last open, None for older RTE
+        self.Caps = None
+        # latest status, replaced as a whole on every change
+        self.Snapshot = YAPLCStatus(self.PLCStatus)
+        self._SnapshotLock = Lock()
+        # public methods queue their serial work here
+        self._Scheduler = YAPLCScheduler()
+        # last flashed images, only changed pages are uploaded
+        self._ImageCache = YAPLCImageCache()
 
         self.TransactionLock.acquire()
         try:
@@ -40,11 +116,75 @@ class YAPLCObject():
             self.SerialConnection = None
             self.PLCStatus = None  # ProjectController is responsible to set "Disconnected" status
         self.TransactionLock.release()
+        self._PublishStatus()
+        if self.SerialConnection is not None:
+            self._Scheduler.Start()
 
     def connect(self, libfile, comportstr, baud, timeout):
-        self.SerialConnection = YAPLCProto(libfile, comportstr, baud, timeout)
+        self.SerialConnection = YAPLCProto(libfile, comportstr, baud, timeout, self.transport)
+        self.SerialConnection.PushSink = self._OnTracePushed
+        self.confnodesroot.logger.write(
+            _("Serial link speed: %d baud\n") % self.SerialConnection.CurrentBaud)
+        self._UpdateCaps()
 
-    def _HandleSerialTransaction(self, transaction, must_do_lock):
+    def Reattach(self, confnodesroot):
+        """
+        Hand open connection to a new connector user,
+        returns False if PLC does not answer any more
+        """
+        self.confnodesroot = confnodesroot
+        self.PLCprint = confnodesroot.logger.writeyield
+        if self.SerialConnection is None:
+            return False
+        self._Scheduler.Call(SCHEDULE_STATUS, self._PollPLCstatus)
+        return self.SerialConnection is not None
+
+    def IdleTime(self):
+        """
+        Seconds since last call that needed serial work
+        """
+        return time.time() - self._Scheduler.LastSubmit
+
+    def Disconnect(self):
+        """
+        Stop background work and close serial port
+        """
+        self._Scheduler.Stop()
+        self.TransactionLock.acquire()
+        try:
+            if self.SerialConnection is not None:
+                self.SerialConnection.Close()
+                self.SerialConnection = None
+            self.PLCStatus = None
+        finally:
+            self.TransactionLock.release()
+        self._PublishStatus()
+        self.StopTraceRecording()
+
+    def _UpdateCaps(self):
+        self.Caps = self.SerialConnection.Caps
+        if self.Caps is not None:
+            self.confnodesroot.logger.write(
+                _("PLC protocol version: %d\n") % self.Caps.Version)
+
+    def GetCapabilities(self):
+        """
+        Return YAPLCCaps of connected RTE, None if RTE does not report them
+        """
+        return self.Caps
+
+    def GetBaudRate(self):
+        """
+        Return negotiated serial link speed, None if not connected
+        """
+        if self.SerialConnection is not None:
+            return self.SerialConnection.CurrentBaud
+        return None
+
+    def _HandleSerialJob(self, job, description, must_do_lock):
+        """
+        job gets YAPLCProto connection and returns (status, result)
+        """
         res = None
         failure = None
         # Must acquire the lock
@@ -53,21 +193,55 @@ class YAPLCObject():
         if self.SerialConnection is not None:
             # Do the job
             try:
-                self.PLCStatus, res = \
-                    self.SerialConnection.HandleTransaction(transaction)
+                self.PLCStatus, res = job(self.SerialConnection)
             except YAPLCProtoError, e:
                 if self.SerialConnection is not None:
                     self.SerialConnection.Close()
                     self.SerialConnection = None
-                failure = str(transaction) + str(e)
+                # nothing left to schedule, later calls fail right away
+                self._Scheduler.Stop()
+                failure = str(description) + str(e)
                 self.PLCStatus = None  # ProjectController is responsible to set "Disconnected" status
             except Exception, e:
-                failure = str(transaction) + str(e)
+                failure = str(description) + str(e)
         # Must release the lock
         if must_do_lock:
             self.TransactionLock.release()
+        self._PublishStatus()
         return res, failure
 
+    def _PublishStatus(self, **changes):
+        """
+        Replace status snapshot, PLCStatus and link speed are taken
+        unless State and Baud are given
+        """
+        self._SnapshotLock.acquire()
+        try:
+            changes.setdefault("State", self.PLCStatus)
+            changes.setdefault("Baud", self.GetBaudRate())
+            self.Snapshot = self.Snapshot.Replace(**changes)
+        finally:
+            self._SnapshotLock.release()
+
+    def GetStatusSnapshot(self):
+        """
+        Return latest YAPLCStatus, never blocks
+        """
+        return self.Snapshot
+
+    def _HandleSerialTransactions(self, transactions, must_do_lock):
+        def job(connection):
+            results = connection.HandleTransactions(transactions)
+            return results[-1][0], [result for status, result in results]
+        res, failure = self._HandleSerialJob(job, transactions, must_do_lock)
+        if res is None:
+            res = [None] * len(transactions)
+        return res, failure
+
+    def _HandleSerialTransaction(self, transaction, must_do_lock):
+        res, failure = self._HandleSerialTransactions([transaction], must_do_lock)
+        return res[0], failure
+
     def HandleSerialTransaction(self, transaction):
         res = None;
         failure = None;
@@ -77,14 +251,54 @@ class YAPLCObject():
             self.confnodesroot.logger.write_warning(failure + "\n")
         return res
 
+    def HandleSerialTransactions(self, transactions):
+        """
+        Do several independent transactions, pipelined when RTE allows it
+        """
+        res, failure = self._HandleSerialTransactions(transactions, True)
+        if failure is not None:
+            self.confnodesroot.logger.write_warning(failure + "\n")
+        return res
+
+    def HandleFeatureTransaction(self, feature, transaction):
+        """
+        Do transaction of optional protocol feature.
+        Returns (supported, result), unsupported features cost nothing
+        after first probe.
+        """
+        def job(connection):
+            answer = connection.HandleFeatureTransaction(feature, transaction)
+            if answer is None:
+                return self.PLCStatus, (False, None)
+            status, res = answer
+            return status, (True, res)
+        res, failure = self._HandleSerialJob(job, transaction, True)
+        if failure is not None:
+            self.confnodesroot.logger.write_warning(failure + "\n")
+            return True, None
+        return res
+
     def StartPLC(self):
+        self._Scheduler.Call(SCHEDULE_COMMAND, self._StartPLC)
+
+    def _StartPLC(self):
         self.HandleSerialTransaction(STARTTransaction())
+        # ack carries status from before command, snapshot must show new one
+        self._PollPLCstatus()
 
     def StopPLC(self):
-        self.HandleSerialTransaction(STOPTransaction())
+        self._Scheduler.Call(SCHEDULE_COMMAND, self._StopPLC)
         return True
 
+    def _StopPLC(self):
+        self.HandleSerialTransaction(STOPTransaction())
+        self._PollPLCstatus()
+
     def NewPLC(self, md5sum, data, extrafiles):
+        return self._Scheduler.Call(
+            SCHEDULE_COMMAND, lambda: self._NewPLC(md5sum, data, extrafiles))
+
+    def _NewPLC(self, md5sum, data, extrafiles):
         if self.MatchMD5(md5sum) == False:
             res = None;
             failure = None;
@@ -93,10 +307,31 @@ class YAPLCObject():
             
             self.confnodesroot.logger.write_warning(
                 _("Will now upload firmware to PLC.\nThis may take some time, don't close the program.\n"))
+            self._PublishStatus(Phase=YAPLC_PHASE_BOOTING, Progress=0.0)
             self.TransactionLock.acquire()
             # Will now boot target
             res, failure = self._HandleSerialTransaction(BOOTTransaction(), False)
-            time.sleep(3)
+            if self.SerialConnection is not None:
+                # bootloader does not push, stop is not sent to it on close
+                self.SerialConnection.Streaming = False
+            flash = ParseFlashCommand(data)
+            if flash is not None:
+                # stm32flash job is done here, over the same port
+                if failure is None:
+                    failure = self._FlashInProcess(flash)
+                self.TransactionLock.release()
+                self._PublishStatus(Phase=YAPLC_PHASE_IDLE, Progress=None)
+                if failure is not None:
+                    self.confnodesroot.logger.write_warning(failure + "\n")
+                    return False
+                self.StopPLC();
+                return self.PLCStatus == "Stopped"
+            if failure is None:
+                # flasher starts as soon as bootloader answers
+                try:
+                    self._WaitBootloader(FlasherBaud(data))
+                except Exception, e:
+                    failure = str(e)
             # Close connection
             self.SerialConnection.Close()
             # bootloader command
@@ -123,13 +358,22 @@ class YAPLCObject():
             # except Exception,e:
             #    failure = str(e)
             command = cmdhead + cmd + cmdtail;
-            status, result, err_result = ProcessLogger(self.confnodesroot.logger, command).spin()
+            if failure is None:
+                self._PublishStatus(Phase=YAPLC_PHASE_UPLOADING, Progress=0.1)
+                status, result, err_result = ProcessLogger(self.confnodesroot.logger, command).spin()
             """
                     TODO: Process output?
             """
             # Reopen connection
+            self._PublishStatus(Phase=YAPLC_PHASE_RECONNECTING, Progress=0.9)
             self.SerialConnection.Open()
+            self._UpdateCaps()
+            # rebooted RTE has no trace variables
+            self._TraceListSynced = False
+            # new program has its own id
+            self._PLCID = None
             self.TransactionLock.release()
+            self._PublishStatus(Phase=YAPLC_PHASE_IDLE, Progress=None)
 
             if failure is not None:
                 self.confnodesroot.logger.write_warning(failure + "\n")
@@ -141,21 +385,156 @@ class YAPLCObject():
             self.StopPLC();
             return self.PLCStatus == "Stopped"
 
+    def _WaitBootloader(self, baud):
+        """
+        Send sync bytes until bootloader RTE jumped to on BOOT answers,
+        returns bootloader session on connector port
+        """
+        connection = self.SerialConnection
+        port = connection.SerialPort
+        port.SetMode(baud, BOOT_MODE)
+        boot = YAPLCStm32Boot(port, connection.timeout, self._FlashProgress)
+        deadline = time.time() + YAPLC_BOOT_READY_TIMEOUT
+        port.SetTimeout(port.ProbeTimeout)
+        try:
+            while not boot.Sync():
+                if time.time() >= deadline:
+                    raise YAPLCBootError("no answer to sync in %g s after BOOT!" % YAPLC_BOOT_READY_TIMEOUT)
+        finally:
+            port.SetTimeout(connection.timeout)
+        return boot
+
+    def _FlashInProcess(self, flash):
+        """
+        Load firmware image with STM32 bootloader on connector port,
+        then get RTE connection back. Returns failure message or None.
+        """
+        connection = self.SerialConnection
+        failure = None
+        try:
+            segments = ReadIntelHex(flash["image"])
+            boot = self._WaitBootloader(BOOT_BAUD)
+            self._PublishStatus(Phase=YAPLC_PHASE_UPLOADING, Progress=0.1)
+            boot.Connect()
+            self._FlashLogged = -1
+            old = self._ImageCache.Get(self._PLCID)
+            pages = None
+            if old is not None:
+                pages = boot.ChangedPages(old, segments)
+                kept = [number for number in boot.PagesOf(segments) if number not in pages]
+                # pages left alone must hold new image already
+                if boot.Matches(boot.PagesSegments(segments, kept)):
+                    self.confnodesroot.logger.write(
+                        _("Flashing %d of %d changed pages\n") % (len(pages), len(pages) + len(kept)))
+                else:
+                    self.confnodesroot.logger.write_warning(_("Cached image does not match PLC, flashing whole image\n"))
+                    pages = None
+            try:
+                # partial upload is checked even without -v
+                boot.Flash(segments, flash["verify"] or pages is not None, None, pages)
+            except YAPLCBootError:
+                if pages is None:
+                    raise
+                # device does not hold cached image, write all of it
+                self.confnodesroot.logger.write_warning(_("Partial upload failed, flashing whole image\n"))
+                self._FlashLogged = -1
+                boot.Flash(segments, flash["verify"], None)
+            if flash["go"] is not None:
+                boot.Go(flash["go"])
+        except Exception, e:
+            failure = str(e)
+        self._PublishStatus(Phase=YAPLC_PHASE_RECONNECTING, Progress=0.9)
+        try:
+            connection.Restart()
+        except Exception, e:
+            connection.Close()
+            self.SerialConnection = None
+            self.PLCStatus = None  # ProjectController is responsible to set "Disconnected" status
+            self._Scheduler.Stop()
+            return (failure or "") + str(e)
+        self._UpdateCaps()
+        # rebooted RTE has no trace variables
+        self._TraceListSynced = False
+        # new program has its own id
+        self._PLCID = None
+        if failure is None:
+            data, error = self._HandleSerialTransaction(GET_PLCIDTransaction(), False)
+            if data is not None:
+                self._PLCID = str(data)
+                self._ImageCache.Put(self._PLCID, flash["image"])
+        return failure
+
+    def _FlashProgress(self, done, total):
+        percent = done * 100 // max(total, 1)
+        self._PublishStatus(Progress=0.1 + 0.8 * done / max(total, 1))
+        if percent // 10 != self._FlashLogged:
+            self._FlashLogged = percent // 10
+            self.confnodesroot.logger.write(_("Flashing PLC: %d%%\n") % percent)
+
     def GetPLCstatus(self):
-        strcounts = self.HandleSerialTransaction(GET_LOGCOUNTSTransaction())
-        if strcounts is not None and len(strcounts) == LogLevelsCount * 4:
-            cstrcounts = ctypes.create_string_buffer(strcounts)
-            ccounts = ctypes.cast(cstrcounts, ctypes.POINTER(ctypes.c_uint32))
-            counts = [int(ccounts[idx]) for idx in xrange(LogLevelsCount)]
+        """
+        Return latest status and log counts, refresh is scheduled
+        and only first call waits for it unless a long operation runs
+        """
+        future = self._Scheduler.Submit(SCHEDULE_STATUS, self._PollPLCstatus, "status")
+        snapshot = self.Snapshot
+        if snapshot.LogCounts is None and snapshot.Phase == YAPLC_PHASE_IDLE:
+            future.Get()
+            snapshot = self.Snapshot
+        return snapshot.State, snapshot.LogCounts or [0] * LogLevelsCount
+
+    def _PollPLCstatus(self):
+        generation = self._TraceGeneration
+        # status, log counts and trace in one round-trip if RTE can do it
+        supported, strbuf = self.HandleFeatureTransaction(
+            "poll", POLLTransaction().SetReplyBuffer(self._PrefetchBuffer))
+        if supported:
+            strcounts = strbuf
+            if strbuf is not None and len(strbuf) > LogLevelsCount * 4 and \
+                    not self._IsStreaming():
+                self._StoreTraceSample(strbuf, generation, LogLevelsCount * 4)
+        elif self._TraceRidesStatus():
+            # trace fetch rides along with status on the wire
+            strcounts, strbuf = self.HandleSerialTransactions([
+                GET_LOGCOUNTSTransaction(),
+                GET_TRACE_VARIABLETransaction().SetReplyBuffer(self._PrefetchBuffer)])
+            self._StoreTraceSample(strbuf, generation)
+        else:
+            strcounts = self.HandleSerialTransaction(GET_LOGCOUNTSTransaction())
+        if strcounts is not None and len(strcounts) >= LogLevelsCount * 4:
+            counts = list(U32Array(LogLevelsCount).unpack_from(strcounts))
+            self._LogCache.SetCounts(counts)
         else:
             counts = [0] * LogLevelsCount
+        self._PublishStatus(LogCounts=counts)
         return self.PLCStatus, counts
 
+    def _TraceRidesStatus(self):
+        """
+        True if status poll fetches trace sample too, separate trace
+        fetch would only repeat it then
+        """
+        connection = self.SerialConnection
+        if connection is None or connection.Streaming or not self._Idxs:
+            return False
+        features = connection.Features
+        if features.get("poll"):
+            return True
+        # single sample is all target gives, it goes along with log counts
+        return features.get("poll") is False and \
+            features.get("samples") is False and \
+            (features.get("delta") is False or self._DeltaTrace.Sizes is None) and \
+            self.PLCStatus == "Started" and connection.GetPipelineDepth() > 1
+
     def MatchMD5(self, MD5):
+        return self._Scheduler.Call(SCHEDULE_COMMAND, lambda: self._MatchMD5(MD5))
+
+    def _MatchMD5(self, MD5):
         self.MatchSwitch = False
         data = self.HandleSerialTransaction(GET_PLCIDTransaction())
         self.MatchSwitch = True
         if data is not None:
+            self._PLCID = str(data)
             return data[:32] == MD5[:32]
         return False
 
@@ -164,60 +543,317 @@ class YAPLCObject():
         Call ctype imported function to append
         these indexes to registred variables in PLC debugger
         """
+        self._Scheduler.Call(SCHEDULE_COMMAND, lambda: self._SetTraceVariablesList(idxs))
+
+    def _SetTraceVariablesList(self, idxs):
+        old = self._Idxs if self._TraceListSynced else None
+        self._DropTraceSamples()
         if idxs:
-            buff = ""
             # keep a copy of requested idx
             self._Idxs = idxs[:]
-            for idx, iectype, force in idxs:
-                idxstr = ctypes.string_at(
-                    ctypes.pointer(
-                        ctypes.c_uint32(idx)), 4)
-                if force != None:
-                    c_type, unpack_func, pack_func = TypeTranslator.get(iectype, (None, None, None))
-                    forced_type_size = ctypes.sizeof(c_type) \
-                        if iectype != "STRING" else len(force) + 1
-                    forced_type_size_str = chr(forced_type_size)
-                    forcestr = ctypes.string_at(
-                        ctypes.pointer(
-                            pack_func(c_type, force)),
-                        forced_type_size)
-                    buff += idxstr + forced_type_size_str + forcestr
-                else:
-                    buff += idxstr + chr(0)
         else:
-            buff = ""
             self._Idxs = []
-        self.HandleSerialTransaction(SET_TRACE_VARIABLETransaction(buff))
+        self._DeltaTrace.Reset([iectype for idx, iectype, force in self._Idxs])
+        self._TraceDecoder.Reset([iectype for idx, iectype, force in self._Idxs])
+        keys = [(idx, iectype) for idx, iectype, force in self._Idxs]
+        if self._PackPlan is None or self._PackPlan.Keys != keys:
+            self._PackPlan = YAPLCPackPlan(keys, self._PackForce)
+            if self._Recorder is not None:
+                # recording holds samples of old layout only
+                self.confnodesroot.logger.write_warning(
+                    _("Trace list changed, recording to %s stopped\n") % self._Recorder.path)
+                self.StopTraceRecording()
+        self._PackPlan.SetForces([force for idx, iectype, force in self._Idxs])
+        res, failure = self._HandleSerialJob(
+            self._TraceListJob(old, self._Idxs), "Set trace list : ", True)
+        self._TraceListSynced = failure is None
+        # pushed while RTE was switching lists
+        self._DropTraceSamples()
+        if failure is not None:
+            self.confnodesroot.logger.write_warning(failure + "\n")
+        self._UpdateTraceStream()
+
+    def _DropTraceSamples(self):
+        """
+        Forget samples not yet returned, also those that
+        fetches already started are still to bring
+        """
+        self._TraceSamplesLock.acquire()
+        self._TraceGeneration += 1
+        self._TraceSamples = []
+        self._TraceSamplesLock.release()
+
+    def _PackForce(self, iectype, force):
+        c_type, unpack_func, pack_func = TypeTranslator.get(iectype, (None, None, None))
+        forced_type_size = ctypes.sizeof(c_type) \
+            if iectype != "STRING" else len(force) + 1
+        forced_type_size_str = chr(forced_type_size)
+        forcestr = ctypes.string_at(
+            ctypes.pointer(
+                pack_func(c_type, force)),
+            forced_type_size)
+        return forced_type_size_str + forcestr
+
+    def _TraceListJob(self, old, new):
+        """
+        Return job that brings RTE trace list from old to new one,
+        only changes are sent when RTE can take them
+        """
+        plan = self._PackPlan
+
+        def upload(connection):
+            return connection.SetTraceList(plan.Data())
+
+        if not old or not new:
+            return upload
+        olds = dict([(idx, (iectype, force)) for idx, iectype, force in old])
+        news = dict([(idx, (iectype, force)) for idx, iectype, force in new])
+        removed = [idx for idx in olds
+                   if idx not in news or news[idx][0] != olds[idx][0]]
+        added = [idx for idx in news
+                 if idx not in olds or news[idx][0] != olds[idx][0]]
+        forced = [idx for idx in news
+                  if idx in olds and news[idx][0] == olds[idx][0] and news[idx][1] != olds[idx][1]]
+        if not (removed or added or forced):
+            # same list again, RTE may have lost it, resync
+            return upload
+        transactions = []
+        if removed:
+            transactions.append(REMOVE_TRACETransaction(
+                "".join([U32.pack(idx) for idx in sorted(removed)])))
+        if added:
+            transactions.append(ADD_TRACETransaction(
+                "".join([plan.Entry(idx) for idx in sorted(added)])))
+        if forced:
+            transactions.append(FORCE_TRACETransaction(
+                "".join([plan.Entry(idx) for idx in sorted(forced)])))
+
+        def delta(connection):
+            maxframe = connection.GetMaxFrame()
+            for transaction in transactions:
+                if not connection.Supports(transaction.Command) or \
+                        1 + len(transaction.Data) > maxframe:
+                    return upload(connection)
+            results = connection.HandleTransactions(transactions)
+            return results[-1][0], None
+        return delta
+
+    def _IsStreaming(self):
+        connection = self.SerialConnection
+        return connection is not None and connection.Streaming
+
+    def _UpdateTraceStream(self):
+        """
+        Make RTE push trace samples while variables are registered,
+        needs a transport that can wait for input without a transaction
+        """
+        period = self.TraceStreamPeriod if self._Idxs else 0
+        connection = self.SerialConnection
+        if connection is None or not hasattr(connection.SerialPort, "WaitReadable"):
+            return
+        if period == 0 and not connection.Streaming:
+            return
+
+        def job(connection):
+            answer = connection.HandleFeatureTransaction(
+                "stream", TRACE_STREAMTransaction(period))
+            if answer is None:
+                return self.PLCStatus, False
+            connection.Streaming = period > 0
+            return answer[0], True
+        res, failure = self._HandleSerialJob(job, "Trace stream : ", True)
+        if failure is not None:
+            self.confnodesroot.logger.write_warning(failure + "\n")
+        if self._IsStreaming() and \
+                (self._StreamThread is None or not self._StreamThread.isAlive()):
+            self._StreamThread = Thread(target=self._StreamReader)
+            self._StreamThread.setDaemon(True)
+            self._StreamThread.start()
+
+    def _StreamReader(self):
+        """
+        Background reader, takes data RTE pushed between transactions.
+        Pushed data coming before a command ack is taken by the transaction.
+        """
+        def job(connection):
+            count = 0
+            if connection.Streaming:
+                count = connection.ReadPushed()
+            return self.PLCStatus, count
+
+        while self._IsStreaming():
+            try:
+                readable = self.SerialConnection.SerialPort.WaitReadable(YAPLC_STREAM_WAIT)
+            except Exception:
+                # port is being reopened
+                time.sleep(YAPLC_STREAM_WAIT)
+                continue
+            if readable:
+                res, failure = self._HandleSerialJob(job, "Trace stream : ", True)
+                if failure is not None:
+                    self.confnodesroot.logger.write_warning(failure + "\n")
+                elif not res:
+                    # input belongs to a running transaction
+                    time.sleep(YAPLC_STREAM_WAIT / 10)
+
+    def _OnTracePushed(self, status, data):
+        self.PLCStatus = status
+        if status == "Started":
+            samples = SplitTraceSamples(data)
+            if samples is None:
+                self.confnodesroot.logger.write_warning(_("Broken trace stream data\n"))
+            else:
+                self._StoreTraceSamples(samples, self._TraceGeneration)
 
     def GetTraceVariables(self):
         """
-        Return a list of variables, corresponding to the list of required idx
+        Return a list of variables, corresponding to the list of required idx.
+        Samples come from fetches done in background, next one is scheduled.
         """
-        strbuf = self.HandleSerialTransaction(GET_TRACE_VARIABLETransaction())
-        TraceVariables = []
-        if strbuf is not None and len(strbuf) >= 4 and self.PLCStatus == "Started":
-            size = len(strbuf) - 4
-            ctick = ctypes.create_string_buffer(strbuf[:4])
-            tick = ctypes.cast(ctick, ctypes.POINTER(ctypes.c_uint32)).contents
+        # streamed samples are collected by background reader
+        if self._TraceRidesStatus():
+            # one round-trip refreshes status, log counts and trace
+            self._Scheduler.Submit(SCHEDULE_TRACE, self._PollPLCstatus, "status")
+        elif not self._IsStreaming():
+            self._Scheduler.Submit(SCHEDULE_TRACE, self._FetchTraceVariables, "trace")
+        self._TraceSamplesLock.acquire()
+        TraceVariables, self._TraceSamples = self._TraceSamples, []
+        self._TraceSamplesLock.release()
+        return self.PLCStatus, TraceVariables
+
+    def GetTraceArrays(self):
+        """
+        Same as GetTraceVariables, samples are decoded into NumPy arrays.
+        Returns status, array of ticks and per variable arrays (YAPLCTraceColumns),
+        ticks and arrays are None if NumPy or registered types do not allow it.
+        """
+        PLCStatus, TraceVariables = self.GetTraceVariables()
+        decoded = None
+        if TraceVariables:
+            decoded = self._TraceDecoder.DecodeSamples(TraceVariables)
+        elif self._TraceDecoder.Available():
+            decoded = self._TraceDecoder.DecodeSamples([])
+        if decoded is None:
+            return PLCStatus, None, None
+        return (PLCStatus,) + decoded
+
+    def _FetchTraceVariables(self):
+        generation = self._TraceGeneration
+        supported = self._IsStreaming()
+        if self._Idxs and not supported:
+            # every sample collected by target since last call
+            supported, strbuf = self.HandleFeatureTransaction(
+                "samples", GET_TRACE_SAMPLESTransaction().SetReplyBuffer(self._TraceBuffer))
+            if supported and strbuf is not None and self.PLCStatus == "Started":
+                self._StoreTraceSamples(SplitTraceSamples(strbuf), generation)
+        if not supported and self._Idxs and self._DeltaTrace.Sizes is not None:
+            # only changed values are transferred if RTE can do it
+            supported, strbuf = self.HandleFeatureTransaction(
+                "delta", GET_TRACE_DELTATransaction(self._DeltaTrace.Tick).SetReplyBuffer(self._TraceBuffer))
+            if supported and strbuf is not None and self.PLCStatus == "Started":
+                sample = self._DeltaTrace.Decode(strbuf)
+                if sample is not None:
+                    self._StoreTraceSamples([sample], generation)
+        if not supported:
+            strbuf = self.HandleSerialTransaction(
+                GET_TRACE_VARIABLETransaction().SetReplyBuffer(self._TraceBuffer))
+            self._StoreTraceSample(strbuf, generation)
+
+    def _StoreTraceSample(self, strbuf, generation, offset=0):
+        if strbuf is not None and len(strbuf) >= offset + 4 and self.PLCStatus == "Started":
+            size = len(strbuf) - offset - 4
+            tick, = TRACE_TICK.unpack_from(strbuf, offset)
             if size > 0:
-                cbuff = ctypes.create_string_buffer(strbuf[4:])
-                buff = ctypes.cast(cbuff, ctypes.c_void_p)
-                TraceBuffer = ctypes.string_at(buff.value, size)
+                # single copy out of the reusable reply buffer
+                TraceBuffer = str(buffer(strbuf, offset + 4))
                 # Add traces
-                TraceVariables.append((tick.value, TraceBuffer))
-        return self.PLCStatus, TraceVariables
+                self._StoreTraceSamples([(tick, TraceBuffer)], generation)
+
+    def _StoreTraceSamples(self, samples, generation):
+        """
+        Keep samples fetched by a job that started at given trace generation,
+        they are dropped if trace list changed since
+        """
+        if samples:
+            self._TraceSamplesLock.acquire()
+            if generation == self._TraceGeneration:
+                self._TraceSamples.extend(samples)
+                if self._Recorder is not None:
+                    try:
+                        self._Recorder.Append(samples)
+                    except (YAPLCRecorderError, EnvironmentError), e:
+                        self.confnodesroot.logger.write_warning(
+                            _("Trace recording stopped: %s\n") % str(e))
+                        self._Recorder.Close()
+                        self._Recorder = None
+            self._TraceSamplesLock.release()
+
+    def StartTraceRecording(self, path):
+        """
+        Record trace samples of registered variables to file at path,
+        see YAPLCTraceRecorder for reading it
+        """
+        recorder = YAPLCTraceRecorder(path, self._Idxs)
+        self._TraceSamplesLock.acquire()
+        old, self._Recorder = self._Recorder, recorder
+        self._TraceSamplesLock.release()
+        if old is not None:
+            old.Close()
+
+    def StopTraceRecording(self):
+        """
+        Stop recording, returns number of recorded samples
+        """
+        self._TraceSamplesLock.acquire()
+        recorder, self._Recorder = self._Recorder, None
+        self._TraceSamplesLock.release()
+        if recorder is None:
+            return 0
+        recorder.Close()
+        return recorder.Count
 
     def ResetLogCount(self):
+        self._Scheduler.Call(SCHEDULE_COMMAND, self._ResetLogCount)
+
+    def _ResetLogCount(self):
         self.HandleSerialTransaction(RESET_LOGCOUNTSTransaction())
+        self._LogCache.Clear()
 
     def GetLogMessage(self, level, msgid):
-        strbuf = self.HandleSerialTransaction(GET_LOGMSGTransaction(level, msgid))
-        if strbuf is not None and len(strbuf) > 12:
-            cbuf = ctypes.cast(
-                ctypes.c_char_p(strbuf[:12]),
-                ctypes.POINTER(ctypes.c_uint32))
-            return (strbuf[12:],) + tuple(int(cbuf[idx]) for idx in range(3))
-        return None
+        if self._PLCID is not None and self._PLCID == self._LogCache.PLCID:
+            message = self._LogCache.Get(level, msgid)
+            if message is not None:
+                return message
+        return self._Scheduler.Call(SCHEDULE_LOG, lambda: self._GetLogMessage(level, msgid))
+
+    def _GetLogMessage(self, level, msgid):
+        if self._PLCID is None:
+            data = self.HandleSerialTransaction(GET_PLCIDTransaction())
+            if data is not None:
+                self._PLCID = str(data)
+        self._LogCache.SetPLCID(self._PLCID)
+        message = self._LogCache.Get(level, msgid)
+        if message is not None:
+            return message
+        # messages around msgid come in one reply if RTE can do it
+        first, last = self._LogCache.Window(level, msgid)
+        supported, strbuf = self.HandleFeatureTransaction(
+            "logrange", GET_LOGMSG_RANGETransaction(level, first, last).SetReplyBuffer(self._LogBuffer))
+        if supported:
+            if strbuf is None:
+                return None
+            messages = SplitLogMessages(strbuf)
+            if messages is None:
+                self.confnodesroot.logger.write_warning(_("Broken log messages data\n"))
+                return None
+        else:
+            strbuf = self.HandleSerialTransaction(
+                GET_LOGMSGTransaction(level, msgid).SetReplyBuffer(self._LogBuffer))
+            if strbuf is None:
+                return None
+            first, messages = msgid, [SplitLogMessage(strbuf)]
+        self._LogCache.Store(level, first, messages)
+        return self._LogCache.Get(level, msgid)
 
     def ForceReload(self):
         raise YAPLCProtoError("Not implemented")
@@ -4,16 +4,42 @@
 #YAPLC connector, based on LPCProto.py and LPCAppProto.py
 #from PLCManager
 
-import ctypes
+import collections
 import exceptions
 import time
 import datetime
 
-import YaPySerial
+import YAPLCTransport
+from YAPLCCodec import *
+from YAPLCFrame import *
 
 YAPLC_STATUS={0xaa: "Started",
               0x55: "Stopped"}
 
+# protocol version spoken by this connector, RTE answers GET_CAPS
+# with the version both ends will use
+YAPLC_PROTO_VERSION = 1
+# command code of bit 0 in GET_CAPS command bitmap
+YAPLC_CAPS_BASE = 0x60
+
+# faster baud rates tried by negotiation, fastest first
+YAPLC_BAUDRATES = [2000000, 1500000, 1000000, 921600, 460800, 230400, 115200]
+# IDLE probes sent at base rate while waiting for RTE to drop failed rate
+YAPLC_BAUD_FALLBACK_PROBES = 5
+# commands kept on the wire in pipelined mode
+YAPLC_PIPELINE_DEPTH = 4
+# IDLE probes while waiting for restarted RTE
+YAPLC_RESTART_PROBES = 10
+# NAK/retransmit attempts for one framed transaction
+YAPLC_FRAME_RETRIES = 3
+# seconds answer frame may be late while pushed frames keep port busy
+YAPLC_FRAME_PUSH_WAIT = 1.0
+# biggest part of trace list carried by one SET_TRACE_CHUNK
+YAPLC_CHUNK_SIZE = 128
+# first byte of trace data RTE pushes in unframed streaming mode,
+# never equal to a command ack
+YAPLC_PUSH_MARKER = "\xa5"
+
 
 class YAPLCProtoError(exceptions.Exception):
         """Exception class"""
@@ -26,25 +52,199 @@ class YAPLCProtoError(exceptions.Exception):
 
 class YAPLCProto:
 
-    def __init__(self, libfile, port, baud, timeout):
+    def __init__(self, libfile, port, baud, timeout, transport = None):
         # serialize access lock
         self.port = port
         self.baud = baud
         self.timeout = timeout
+        # rate in use after negotiation, base rate is restored on every open
+        self.CurrentBaud = baud
+        self.NegotiateBaud = True
+        self.PipelineDepth = YAPLC_PIPELINE_DEPTH
+        # set when RTE answers protocol extension commands,
+        # older RTE is driven in lock-step mode only
+        self.Extended = False
+        # optional feature name -> True/False once probed
+        self.Features = {}
+        # YAPLCCaps of RTE that answers GET_CAPS, features are not probed then
+        self.Caps = None
+        # CRC framed transfers, used when RTE supports them
+        self.UseFraming = True
+        self.Framing = False
+        self.Sequence = 0
+        # corrupted or lost frames recovered by retry
+        self.FrameErrors = 0
+        # RTE pushes trace data on its own, see TRACE_STREAMTransaction
+        self.Streaming = False
+        # called with (status, data) for every pushed data block,
+        # data is valid during the call only
+        self.PushSink = None
+        # unframed pushed blocks are read into it
+        self._PushBuffer = bytearray(PUSH_HEADER.size)
         # open serial port
-        self.SerialPort = YaPySerial.YaPySerial(libfile)
+        self.SerialPort = YAPLCTransport.TransportFactory(transport, libfile)
         self.Open()
 
 
     def Open(self):
-        self.SerialPort.Open( self.port, self.baud, "8N1", self.timeout )
-        # start with empty buffer
-        self.SerialPort.Flush()
+        # start with empty buffer, open with short idle timeout
+        # to drain stale input in bulk, then switch to protocol timeout
+        idle = self.SerialPort.FlushTimeout
+        self.SerialPort.Open( self.port, self.baud, "8N1", idle )
+        self.Handshake()
+
+
+    def Restart(self):
+        """
+        Take open port back at base rate after someone else used it
+        (bootloader) and wait for RTE to start
+        """
+        self.SerialPort.SetMode(self.baud, "8N1")
+        self.SerialPort.Flush(self.SerialPort.FlushTimeout)
+        self.SerialPort.SetTimeout(self.timeout)
+        self.CurrentBaud = self.baud
+        self.Framing = False
+        self.Streaming = False
+        for attempt in xrange(YAPLC_RESTART_PROBES):
+            if self.ProbeTransaction(IDLETransaction()) is not None:
+                break
+        else:
+            raise YAPLCProtoError("controller did not start!")
+        self.Handshake()
+
+
+    def Handshake(self):
+        """
+        Start over with empty buffer, find out what RTE can do
+        """
+        self.SerialPort.Flush(self.SerialPort.FlushTimeout)
+        self.SerialPort.SetTimeout(self.timeout)
+        self.CurrentBaud = self.baud
+        self.Extended = False
+        self.Features = {}
+        self.Framing = False
+        self.Streaming = False
+        self.Caps = None
+        # RTE may still push trace data for previous connection
+        self.StopStream()
+        answer = self.ProbeTransaction(GET_CAPSTransaction())
+        if answer is not None:
+            self.Caps = answer[1]
+            self.Extended = True
+        if self.NegotiateBaud:
+            self.Negotiate()
+        if self.UseFraming and self.Extended:
+            # RTE frames its replies after FRAMING ack only
+            if self.Caps is None or self.Caps.Supports(FRAMINGTransaction().Command):
+                self.Framing = self.ProbeTransaction(FRAMINGTransaction()) is not None
+
+
+    def StopStream(self):
+        """
+        Ask RTE to stop pushing trace data, data pushed before ack is dropped.
+        RTE that can't stream lets probe time out.
+        """
+        self.Streaming = True
+        sink, self.PushSink = self.PushSink, None
+        try:
+            self.ProbeTransaction(TRACE_STREAMTransaction(0))
+        finally:
+            self.Streaming = False
+            self.PushSink = sink
+
+
+    def ProbeTransaction(self, transaction):
+        """
+        Do transaction older RTE may not know with short answer timeout.
+        Returns (status, result) or None if controller did not answer.
+        """
+        self.SerialPort.SetTimeout(self.SerialPort.ProbeTimeout)
+        try:
+            try:
+                return self.HandleTransaction(transaction)
+            except YAPLCProtoError:
+                # drop partial answer, if any
+                self.SerialPort.Flush(self.SerialPort.FlushTimeout)
+                return None
+        finally:
+            self.SerialPort.SetTimeout(self.timeout)
+
+
+    def HandleFeatureTransaction(self, feature, transaction):
+        """
+        Do transaction of optional feature, first one is a probe.
+        Returns (status, result) or None if RTE does not support feature.
+        """
+        supported = self.Features.get(feature)
+        if supported is None and self.Caps is not None:
+            supported = self.Features[feature] = self.Caps.Supports(transaction.Command)
+        if supported is None:
+            if not self.Extended:
+                self.Features[feature] = False
+                return None
+            answer = self.ProbeTransaction(transaction)
+            self.Features[feature] = answer is not None
+            return answer
+        if supported:
+            return self.HandleTransaction(transaction)
+        return None
+
+
+    def Negotiate(self):
+        """
+        Switch both ends to fastest baud rate supported by RTE and transport.
+        Older RTE does not answer GET_BAUDRATES and link stays at base rate.
+        """
+        if self.Caps is not None:
+            if not self.Caps.Supports(SET_BAUDRATETransaction(0).Command):
+                return self.CurrentBaud
+            rates = self.Caps.BaudRates
+        else:
+            answer = self.ProbeTransaction(GET_BAUDRATESTransaction())
+            if answer is None:
+                return self.CurrentBaud
+            self.Extended = True
+            status, rates = answer
+        for baud in YAPLC_BAUDRATES:
+            if baud <= self.baud:
+                break
+            if baud in rates and self.SerialPort.SupportsBaud(baud):
+                if self.SwitchBaud(baud):
+                    break
+        return self.CurrentBaud
+
+
+    def SwitchBaud(self, baud):
+        """
+        RTE changes rate after SET_BAUDRATE ack was sent and
+        returns to previous rate when no valid command comes at new one.
+        Returns True if link works at new rate.
+        """
+        if self.ProbeTransaction(SET_BAUDRATETransaction(baud)) is None:
+            return False
+        try:
+            self.SerialPort.SetMode(baud)
+        except Exception:
+            # transport refused rate it claimed to support,
+            # RTE falls back as no command comes at new rate
+            pass
+        else:
+            if self.ProbeTransaction(IDLETransaction()) is not None:
+                self.CurrentBaud = baud
+                return True
+        # fall back and wait for RTE to do the same
+        self.SerialPort.SetMode(self.CurrentBaud)
+        for attempt in xrange(YAPLC_BAUD_FALLBACK_PROBES):
+            if self.ProbeTransaction(IDLETransaction()) is not None:
+                return False
+        raise YAPLCProtoError("controller lost after baud rate switch!")
 
 
     def HandleTransaction(self, transaction):
+        if self.Framing:
+            return self._HandlePipeline([transaction], 1)[0]
         try:
-            transaction.SetSerialPort(self.SerialPort)
+            transaction.SetSerialPort(self._CommandPort())
             # send command, wait ack (timeout)
             transaction.SendCommand()
             current_plc_status = transaction.GetCommandAck()
@@ -58,7 +258,239 @@ class YAPLCProto:
         return YAPLC_STATUS.get(current_plc_status,"Broken"), res
 
 
+    def Supports(self, command):
+        """
+        True if RTE reported command in its capabilities
+        """
+        return self.Caps is not None and self.Caps.Supports(command)
+
+
+    def GetMaxFrame(self):
+        """
+        Biggest request frame payload RTE accepts, None if unknown
+        """
+        if self.Caps is not None:
+            return self.Caps.MaxFrame
+        return None
+
+
+    def SetTraceList(self, data):
+        """
+        Upload trace list. RTE that can do it gets it in chunks, as many
+        as fit in its receive buffer are on the wire, every ack lets
+        next one go. Returns (status, None).
+        """
+        if not self.Supports(SET_TRACE_CHUNKTransaction(0, 0, "").Command):
+            return self.HandleTransaction(SET_TRACE_VARIABLETransaction(data))
+        overhead = 1 + CHUNK_HEADER.size
+        if self.Framing:
+            overhead += FRAME_OVERHEAD
+        size = max(min(YAPLC_CHUNK_SIZE, self.Caps.MaxFrame - overhead), 1)
+        window = max(self.Caps.MaxFrame // (size + overhead), 1)
+        transactions = [SET_TRACE_CHUNKTransaction(offset, len(data), data[offset:offset + size])
+                        for offset in xrange(0, max(len(data), 1), size)]
+        status, received = self._HandlePipeline(transactions, window)[-1]
+        if received != len(data):
+            raise YAPLCProtoError("trace list upload incomplete, RTE got " +
+                                  str(received) + " of " + str(len(data)) + " bytes!")
+        return status, None
+
+
+    def GetPipelineDepth(self):
+        if self.Extended:
+            return max(self.PipelineDepth, 1)
+        return 1
+
+
+    def HandleTransactions(self, transactions):
+        """
+        Pipelined mode: up to PipelineDepth commands with their data
+        are written back to back and answers are matched in order.
+        Falls back to lock-step mode for older RTE or depth 1.
+        Returns list of (status, result) in transaction order.
+        """
+        depth = self.GetPipelineDepth()
+        if depth == 1 and not self.Framing:
+            return [self.HandleTransaction(transaction) for transaction in transactions]
+        return self._HandlePipeline(transactions, depth)
+
+
+    def _HandlePipeline(self, transactions, depth):
+        results = []
+        if self.Framing:
+            # retry of older request would be executed again by RTE
+            depth = min(depth, FRAME_REPEAT_WINDOW)
+        try:
+            pending = collections.deque(transactions)
+            inflight = collections.deque()
+
+            def send(count):
+                request = bytearray()
+                while pending and count > 0:
+                    transaction = pending.popleft()
+                    if self.Framing:
+                        payload = bytearray()
+                        transaction.AppendRequest(payload)
+                        if len(payload) > (self.GetMaxFrame() or FRAME_MAX_PAYLOAD):
+                            raise YAPLCProtoError("request does not fit in a frame!")
+                        seq = self.Sequence
+                        self.Sequence = (seq + 1) % FRAME_PUSH_SEQ
+                        frame = EncodeFrame(seq, payload)
+                        request.extend(frame)
+                        inflight.append((transaction, seq, frame))
+                    else:
+                        transaction.SetSerialPort(self._CommandPort())
+                        transaction.AppendRequest(request)
+                        inflight.append((transaction, None, None))
+                    count -= 1
+                self.SerialPort.WriteFrom(request)
+
+            # replies that came before the one waited for, by seq
+            early = {}
+            send(depth)
+            while inflight:
+                transaction, seq, frame = inflight.popleft()
+                if self.Framing:
+                    later = [entry[1] for entry in inflight]
+                    transaction.SetSerialPort(
+                        YAPLCFrameReader(self._ReceiveFrame(seq, frame, later, early)))
+                current_plc_status, res = transaction.GetResponse()
+                results.append((YAPLC_STATUS.get(current_plc_status,"Broken"), res))
+                if pending:
+                    send(1)
+        except Exception, e:
+            msg = "PLC protocol transaction error : "+str(e)
+            raise YAPLCProtoError( msg )
+        return results
+
+
+    def _ReceiveFrame(self, seq, frame, later = (), early = None):
+        """
+        Return reply payload for request frame seq.
+        Broken reply is NAKed, missing one is requested again.
+        Replies of later requests still on the wire are kept in early,
+        first one also tells reply for seq was lost, RTE answers in order.
+        Frames of other (already handled) requests are skipped.
+        Reply to retry is already made, it is waited for with short timeout
+        unless transport has to reopen port to change it.
+        Pushed frames do not let read time out, so answer is also
+        requested again when they kept coming for YAPLC_FRAME_PUSH_WAIT.
+        """
+        if early is None:
+            early = {}
+        if seq in early:
+            return early.pop(seq)
+        attempts = 0
+        deadline = time.time() + YAPLC_FRAME_PUSH_WAIT
+        try:
+            while True:
+                try:
+                    answer = self._ReadFrame()
+                    if answer is None:
+                        retry = frame
+                    else:
+                        rseq, payload = answer
+                        if rseq == seq:
+                            return payload
+                        if rseq == FRAME_PUSH_SEQ:
+                            self._Pushed(payload)
+                            if time.time() < deadline:
+                                continue
+                            retry = frame
+                        elif rseq not in later or rseq in early:
+                            continue
+                        else:
+                            early[rseq] = payload
+                            if attempts:
+                                # retry is on its way already
+                                continue
+                            retry = frame
+                except YAPLCFrameError:
+                    retry = EncodeFrame(seq, "")
+                self.FrameErrors += 1
+                attempts += 1
+                if attempts > YAPLC_FRAME_RETRIES:
+                    raise YAPLCProtoError("no valid answer frame after retries!")
+                if attempts == 1 and not self.SerialPort.TimeoutReopens:
+                    # reopen would drop early and late replies
+                    self.SerialPort.SetTimeout(self.SerialPort.ProbeTimeout)
+                self.SerialPort.WriteFrom(retry)
+                deadline = time.time() + YAPLC_FRAME_PUSH_WAIT
+        finally:
+            if attempts:
+                self.SerialPort.SetTimeout(self.timeout)
+
+
+    def _ReadFrame(self, synced = False):
+        return ReadFrame(self.SerialPort, synced, self.GetMaxFrame() or FRAME_MAX_PAYLOAD)
+
+
+    def _CommandPort(self):
+        if self.Streaming:
+            return YAPLCPushFilter(self)
+        return self.SerialPort
+
+
+    def _Pushed(self, payload):
+        # framed push: status byte followed by data
+        if len(payload) < 1:
+            raise YAPLCProtoError("empty pushed frame!")
+        if self.PushSink is not None:
+            self.PushSink(YAPLC_STATUS.get(ord(payload[0]), "Broken"),
+                          buffer(payload, 1))
+
+
+    def ReadPush(self):
+        """
+        Read rest of unframed pushed block after YAPLC_PUSH_MARKER
+        """
+        buf = self._PushBuffer
+        if self.SerialPort.ReadInto(buf, PUSH_HEADER.size) is None:
+            raise YAPLCProtoError("truncated pushed data header!")
+        status, length = PUSH_HEADER.unpack_from(buf)
+        if len(buf) < length:
+            buf.extend("\0" * (length - len(buf)))
+        if length > 0 and self.SerialPort.ReadInto(buf, length) is None:
+            raise YAPLCProtoError("truncated pushed data!")
+        if self.PushSink is not None:
+            self.PushSink(YAPLC_STATUS.get(status, "Broken"), buffer(buf, 0, length))
+
+
+    def ReadPushed(self):
+        """
+        Handle data RTE pushed while no transaction was running,
+        transport must support ReadAvailable.
+        Returns number of pushed blocks handled.
+        """
+        count = 0
+        try:
+            while True:
+                byte = self.SerialPort.ReadAvailable(1)
+                if not byte:
+                    return count
+                if self.Framing and byte == FRAME_SYNC:
+                    answer = self._ReadFrame(True)
+                    # late replies to finished requests are dropped
+                    if answer is not None and answer[0] == FRAME_PUSH_SEQ:
+                        self._Pushed(answer[1])
+                        count += 1
+                elif not self.Framing and byte == YAPLC_PUSH_MARKER:
+                    self.ReadPush()
+                    count += 1
+        except YAPLCProtoError:
+            raise
+        except Exception, e:
+            msg = "PLC protocol stream error : "+str(e)
+            raise YAPLCProtoError( msg )
+
+
     def Close(self):
+        if self.SerialPort and self.Streaming:
+            # stream would outlive connection otherwise
+            try:
+                self.StopStream()
+            except Exception:
+                pass
         if self.SerialPort:
             try:
                 self.SerialPort.Close()
@@ -70,17 +502,78 @@ class YAPLCProto:
         self.Close()
 
 
+class YAPLCCaps:
+    """
+    RTE capabilities from GET_CAPS reply
+    """
+    def __init__(self, version, maxframe, commands, baudrates):
+        self.Version = version
+        self.MaxFrame = maxframe
+        self.Commands = commands
+        self.BaudRates = baudrates
+
+    def Supports(self, command):
+        bit = command - YAPLC_CAPS_BASE
+        return 0 <= bit < 32 and bool(self.Commands & (1 << bit))
+
+
+class YAPLCPushFilter:
+    """
+    Serial port wrapper used by unframed transactions while streaming.
+    RTE may push trace data before command ack, ack read handles it first.
+    """
+    def __init__(self, proto):
+        self.proto = proto
+        self.SerialPort = proto.SerialPort
+        self.AckPending = True
+
+    def Read(self, nbytes):
+        if not self.AckPending:
+            return self.SerialPort.Read(nbytes)
+        self.AckPending = False
+        while True:
+            byte = self.SerialPort.Read(1)
+            if byte != YAPLC_PUSH_MARKER:
+                break
+            self.proto.ReadPush()
+        if byte is None or nbytes == 1:
+            return byte
+        rest = self.SerialPort.Read(nbytes - 1)
+        if rest is None:
+            return None
+        return byte + rest
+
+    def ReadInto(self, buffer, nbytes, offset = 0):
+        return self.SerialPort.ReadInto(buffer, nbytes, offset)
+
+    def Write(self, buf):
+        return self.SerialPort.Write(buf)
+
+    def WriteFrom(self, buf, nbytes = None, offset = 0):
+        return self.SerialPort.WriteFrom(buf, nbytes, offset)
+
+
 class YAPLCTransaction:
 
     def __init__(self, command):
         self.Command = command
         self.SerialPort = None
+        self.ReplyBuffer = None
+        # data sent after command ack
+        self.Data = None
 
 
     def SetSerialPort(self, SerialPort):
         self.SerialPort = SerialPort
 
 
+    def SetReplyBuffer(self, ReplyBuffer):
+        # caller owned bytearray, GetData fills it in place instead of
+        # returning a new string
+        self.ReplyBuffer = ReplyBuffer
+        return self
+
+
     def SendCommand(self):
         # send command thread
         self.SerialPort.Write(chr(self.Command))
@@ -101,10 +594,12 @@ class YAPLCTransaction:
 
 
     def SendData(self, Data):
-        return self.SerialPort.Write(Data)
+        return self.SerialPort.WriteFrom(Data)
 
 
     def GetData(self):
+        if self.ReplyBuffer is not None:
+            return self._GetDataInto(self.ReplyBuffer)
         lengthstr = self.SerialPort.Read(4)
         if lengthstr is None:
             raise YAPLCProtoError("YAPLC transaction error - can't read data length!")
@@ -113,10 +608,7 @@ class YAPLCTransaction:
                 raise YAPLCProtoError("YAPLC transaction error - data length is invalid: " + str(len(lengthstr) + " !"))
 
         # transform a byte string into length
-        length = ctypes.cast(
-            ctypes.c_char_p(lengthstr),
-            ctypes.POINTER(ctypes.c_uint32)
-            ).contents.value
+        length, = LENGTH.unpack(lengthstr)
         if length > 0:
             data = self.SerialPort.Read(length)
             if data is None:
@@ -131,14 +623,50 @@ class YAPLCTransaction:
             return None
 
 
+    def _GetDataInto(self, buf):
+        # length is read into reply buffer too, no string is made per reply
+        if len(buf) < LENGTH.size:
+            buf.extend("\0" * (LENGTH.size - len(buf)))
+        if self.SerialPort.ReadInto(buf, LENGTH.size) is None:
+            raise YAPLCProtoError("YAPLC transaction error - can't read data length!")
+        length, = LENGTH.unpack_from(buf)
+        if length == 0:
+            return None
+        if len(buf) != length:
+            buf[length:] = ""
+            buf.extend("\0" * (length - len(buf)))
+        if self.SerialPort.ReadInto(buf, length) is None:
+            raise YAPLCProtoError("YAPLC transaction error - can't read data!")
+        return buf
+
+
     def ExchangeData(self):
+        if self.Data is not None:
+            self.SendData(self.Data)
+        return self.ReceiveData()
+
+
+    def ReceiveData(self):
         pass
 
 
+    def AppendRequest(self, request):
+        # pipelined mode sends data right after command without waiting ack
+        request.append(self.Command)
+        if self.Data is not None:
+            request.extend(self.Data)
+
+
+    def GetResponse(self):
+        current_plc_status = self.GetCommandAck()
+        if current_plc_status is None:
+            raise YAPLCProtoError("controller did not answer as expected!")
+        return current_plc_status, self.ReceiveData()
+
+
 class IDLETransaction(YAPLCTransaction):
     def __init__(self):
         YAPLCTransaction.__init__(self, 0x6a)
-    #ExchangeData = YAPLCTransaction.GetData
 
 
 class STARTTransaction(YAPLCTransaction):
@@ -159,44 +687,33 @@ class BOOTTransaction(YAPLCTransaction):
 class SET_TRACE_VARIABLETransaction(YAPLCTransaction):
     def __init__(self, data):
         YAPLCTransaction.__init__(self, 0x64)
-        length = len(data)
-        # transform length into a byte string
-        # we presuppose endianess of LPC same as PC
-        lengthstr = ctypes.string_at(ctypes.pointer(ctypes.c_uint32(length)),4)
-        self.Data = lengthstr + data
-
-    def ExchangeData(self):
-        self.SendData(self.Data)
+        self.Data = LengthPrefixed(data)
 
 
 class GET_TRACE_VARIABLETransaction(YAPLCTransaction):
     def __init__(self):
         YAPLCTransaction.__init__(self, 0x65)
-    ExchangeData = YAPLCTransaction.GetData
+    ReceiveData = YAPLCTransaction.GetData
 
 
 class GET_PLCIDTransaction(YAPLCTransaction):
     def __init__(self):
         YAPLCTransaction.__init__(self, 0x66)
-    ExchangeData = YAPLCTransaction.GetData
+    ReceiveData = YAPLCTransaction.GetData
 
 
 class GET_LOGCOUNTSTransaction(YAPLCTransaction):
     def __init__(self):
         YAPLCTransaction.__init__(self, 0x67)
-    ExchangeData = YAPLCTransaction.GetData
+    ReceiveData = YAPLCTransaction.GetData
 
 
 class GET_LOGMSGTransaction(YAPLCTransaction):
     def __init__(self,level,msgid):
         YAPLCTransaction.__init__(self, 0x68)
-        msgidstr = ctypes.string_at(ctypes.pointer(ctypes.c_int(msgid)),4)
-        self.Data = chr(level)+msgidstr
+        self.Data = LOGMSG_REQUEST.pack(level, msgid)
 
-    def ExchangeData(self):
-        #pass
-        self.SendData(self.Data)
-        return self.GetData()
+    ReceiveData = YAPLCTransaction.GetData
 
 
 class RESET_LOGCOUNTSTransaction(YAPLCTransaction):
@@ -207,18 +724,137 @@ class SETRTCTransaction(YAPLCTransaction):
     def __init__(self):
         YAPLCTransaction.__init__(self, 0x6b)
         dt = datetime.datetime.now()
-        
-        year = dt.year%100
-        year   = ctypes.string_at(ctypes.pointer(ctypes.c_uint8(year))       ,1)
-        mon    = ctypes.string_at(ctypes.pointer(ctypes.c_uint8(dt.month))   ,1)
-        day    = ctypes.string_at(ctypes.pointer(ctypes.c_uint8(dt.day))     ,1)
-        hour   = ctypes.string_at(ctypes.pointer(ctypes.c_uint8(dt.hour))    ,1)
-        minute = ctypes.string_at(ctypes.pointer(ctypes.c_uint8(dt.minute))  ,1)
-        second = ctypes.string_at(ctypes.pointer(ctypes.c_uint8(dt.second))  ,1)
-        self.Data = year+mon+day+hour+minute+second
+        self.Data = RTC.pack(dt.year % 100, dt.month, dt.day,
+                             dt.hour, dt.minute, dt.second)
 
-    def ExchangeData(self):
-        self.SendData(self.Data)
+class GET_BAUDRATESTransaction(YAPLCTransaction):
+    def __init__(self):
+        YAPLCTransaction.__init__(self, 0x6c)
+
+    def ReceiveData(self):
+        data = self.GetData()
+        if data is None:
+            return []
+        return list(U32Array(len(data) // 4).unpack_from(data))
+
+
+class SET_BAUDRATETransaction(YAPLCTransaction):
+    def __init__(self, baud):
+        YAPLCTransaction.__init__(self, 0x6d)
+        self.Data = U32.pack(baud)
+
+class POLLTransaction(YAPLCTransaction):
+    """
+    Log counts followed by pending trace sample (tick and buffer), if any
+    """
+    def __init__(self):
+        YAPLCTransaction.__init__(self, 0x6e)
+    ReceiveData = YAPLCTransaction.GetData
+
+class FRAMINGTransaction(YAPLCTransaction):
+    """
+    Acked by RTE that understands CRC framed requests
+    """
+    def __init__(self):
+        YAPLCTransaction.__init__(self, 0x6f)
+
+class GET_TRACE_DELTATransaction(YAPLCTransaction):
+    """
+    Trace sample as changes since acknowledged tick, see YAPLCTrace
+    """
+    def __init__(self, tick):
+        YAPLCTransaction.__init__(self, 0x70)
+        self.Data = TRACE_TICK.pack(tick)
+    ReceiveData = YAPLCTransaction.GetData
+
+class GET_TRACE_SAMPLESTransaction(YAPLCTransaction):
+    """
+    All trace samples pending in target ring, oldest first
+    """
+    def __init__(self):
+        YAPLCTransaction.__init__(self, 0x71)
+    ReceiveData = YAPLCTransaction.GetData
+
+class TRACE_STREAMTransaction(YAPLCTransaction):
+    """
+    Ask RTE to push trace samples every period ms, 0 stops streaming.
+    Pushed data is GET_TRACE_SAMPLES like list of samples, RTE sends it
+    between transactions only, never inside a reply.
+    """
+    def __init__(self, period):
+        YAPLCTransaction.__init__(self, 0x72)
+        self.Data = U32.pack(period)
+
+class GET_LOGMSG_RANGETransaction(YAPLCTransaction):
+    """
+    Log messages first..last-1 of level, each one is size followed by
+    GET_LOGMSG reply, see YAPLCLog
+    """
+    def __init__(self, level, first, last):
+        YAPLCTransaction.__init__(self, 0x73)
+        self.Data = LOGMSG_RANGE_REQUEST.pack(level, first, last)
+    ReceiveData = YAPLCTransaction.GetData
+
+class SET_TRACE_CHUNKTransaction(YAPLCTransaction):
+    """
+    Part of trace list at offset, RTE applies list when last part came.
+    Reply is count of list bytes RTE got in order so far.
+    """
+    def __init__(self, offset, total, chunk):
+        YAPLCTransaction.__init__(self, 0x75)
+        self.Data = CHUNK_HEADER.pack(offset, total, len(chunk)) + chunk
+
+    def ReceiveData(self):
+        data = self.GetData()
+        if data is None or len(data) != U32.size:
+            raise YAPLCProtoError("YAPLC transaction error - chunk ack is invalid!")
+        return U32.unpack(data)[0]
+
+class ADD_TRACETransaction(YAPLCTransaction):
+    """
+    Register more trace variables, data is laid out as SET_TRACE_VARIABLE one
+    """
+    def __init__(self, data):
+        YAPLCTransaction.__init__(self, 0x76)
+        self.Data = LengthPrefixed(data)
+
+class REMOVE_TRACETransaction(YAPLCTransaction):
+    """
+    Unregister trace variables, data is their uint32 indexes
+    """
+    def __init__(self, data):
+        YAPLCTransaction.__init__(self, 0x77)
+        self.Data = LengthPrefixed(data)
+
+class FORCE_TRACETransaction(YAPLCTransaction):
+    """
+    Change force values of registered variables, data is laid out as
+    SET_TRACE_VARIABLE one, zero force size releases force
+    """
+    def __init__(self, data):
+        YAPLCTransaction.__init__(self, 0x78)
+        self.Data = LengthPrefixed(data)
+
+class GET_CAPSTransaction(YAPLCTransaction):
+    """
+    Protocol version, frame size, optional commands and baud rates of RTE.
+    Request carries connector protocol version.
+    """
+    def __init__(self):
+        YAPLCTransaction.__init__(self, 0x74)
+        self.Data = U16.pack(YAPLC_PROTO_VERSION)
+
+    def ReceiveData(self):
+        data = self.GetData()
+        if data is None or len(data) < CAPS_HEADER.size or \
+                (len(data) - CAPS_HEADER.size) % U32.size:
+            raise YAPLCProtoError("YAPLC transaction error - capabilities are invalid!")
+        version, maxframe, commands = CAPS_HEADER.unpack_from(data)
+        if version == 0 or version > YAPLC_PROTO_VERSION:
+            raise YAPLCProtoError("YAPLC transaction error - unsupported protocol version: " + str(version) + " !")
+        count = (len(data) - CAPS_HEADER.size) // U32.size
+        rates = list(U32Array(count).unpack_from(data, CAPS_HEADER.size))
+        return YAPLCCaps(version, maxframe, commands, rates)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Trace samples recorded to disk.
+#
+# File: RECORDING_HEADER, RECORDING_VARIABLE per traced variable,
+# then fixed size records, RECORD_HEADER followed by sample buffer.
+# Records are reached through a memory mapped window of the file,
+# so memory use does not depend on recording length.
+
+import exceptions
+import os
+import mmap
+import array
+import bisect
+
+from YAPLCCodec import *
+
+RECORDING_MAGIC = "YAPLCTRC"
+RECORDING_VERSION = 1
+# bytes of file mapped at once
+RECORDING_WINDOW = 1 << 20
+# one tick index entry every RECORDING_INDEX_STRIDE records
+RECORDING_INDEX_STRIDE = 1024
+
+
+class YAPLCRecorderError(exceptions.Exception):
+        """Exception class"""
+        def __init__(self, msg):
+                self.msg = msg
+
+        def __str__(self):
+                return "Exception in YAPLC trace recorder : " + str(self.msg)
+
+
+def SampleMaxSize(iectypes):
+    """
+    Biggest trace sample of variables of iectypes
+    """
+    size = 0
+    for iectype in iectypes:
+        typesize = IEC_TYPE_SIZES.get(iectype)
+        if typesize is None:
+            if iectype != "STRING":
+                raise YAPLCRecorderError("can't record " + iectype + " variable!")
+            typesize = IEC_STRING_MAX_SIZE
+        size += typesize
+    return size
+
+
+class YAPLCTraceRecorder:
+    """
+    Trace recording file. Given variables (idx, iectype, ...) a new file
+    is created and samples are appended, otherwise existing file is
+    opened for reading. Ticks are extended to 64 bits counting wraps,
+    so record ticks never decrease and Seek can bisect them.
+    """
+    def __init__(self, path, idxs = None):
+        self.path = path
+        self.Writable = idxs is not None
+        self._Window = None
+        self._WindowStart = 0
+        self._WindowEnd = 0
+        # first tick of every RECORDING_INDEX_STRIDE records
+        self._Index = array.array("d")
+        self._LastTick = None
+        if self.Writable:
+            self.Idxs = [(entry[0], entry[1]) for entry in idxs]
+            self.RecordSize = RECORD_HEADER.size + SampleMaxSize([iectype for idx, iectype in self.Idxs])
+            self.Count = 0
+            self._File = open(path, "w+b")
+            header = RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION,
+                                           self.RecordSize, len(self.Idxs), 0)
+            for idx, iectype in self.Idxs:
+                header += RECORDING_VARIABLE.pack(idx, iectype)
+            self._File.write(header)
+            self._File.flush()
+            self.DataOffset = len(header)
+            self._FileSize = self.DataOffset
+            self._Header = mmap.mmap(self._File.fileno(), RECORDING_HEADER.size)
+        else:
+            self._Open()
+
+    def _Open(self):
+        try:
+            self._File = open(self.path, "rb")
+        except IOError, e:
+            raise YAPLCRecorderError("Couldn't open " + self.path + ": " + str(e))
+        data = self._File.read(RECORDING_HEADER.size)
+        if len(data) < RECORDING_HEADER.size:
+            raise YAPLCRecorderError(self.path + " is not a trace recording!")
+        magic, version, self.RecordSize, count, self.Count = RECORDING_HEADER.unpack(data)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise YAPLCRecorderError(self.path + " is not a trace recording!")
+        data = self._File.read(count * RECORDING_VARIABLE.size)
+        if len(data) < count * RECORDING_VARIABLE.size:
+            raise YAPLCRecorderError(self.path + " is truncated!")
+        self.Idxs = [RECORDING_VARIABLE.unpack_from(data, n * RECORDING_VARIABLE.size)
+                     for n in xrange(count)]
+        self.Idxs = [(idx, iectype.rstrip("\0")) for idx, iectype in self.Idxs]
+        self.DataOffset = RECORDING_HEADER.size + count * RECORDING_VARIABLE.size
+        self._FileSize = os.fstat(self._File.fileno()).st_size
+        # records written after last header update are lost with writer
+        self.Count = min(self.Count, (self._FileSize - self.DataOffset) // self.RecordSize)
+        self._Header = None
+        for record in xrange(0, self.Count, RECORDING_INDEX_STRIDE):
+            self._Index.append(self._Tick(record))
+        if self.Count:
+            self._LastTick = self._Tick(self.Count - 1)
+
+    def _Map(self, record):
+        """
+        Return mapped window holding record and record offset in it
+        """
+        offset = self.DataOffset + record * self.RecordSize
+        if not (self._WindowStart <= offset and offset + self.RecordSize <= self._WindowEnd):
+            start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            end = offset + max(RECORDING_WINDOW, self.RecordSize)
+            end -= (end - offset) % self.RecordSize
+            if self._Window is not None:
+                self._Window.close()
+                self._Window = None
+            if self.Writable:
+                if end > self._FileSize:
+                    self._Grow(end)
+                access = mmap.ACCESS_WRITE
+            else:
+                end = min(end, self._FileSize)
+                access = mmap.ACCESS_READ
+            self._Window = mmap.mmap(self._File.fileno(), end - start, access = access, offset = start)
+            self._WindowStart = start
+            self._WindowEnd = end
+        return self._Window, offset - self._WindowStart
+
+    def _Grow(self, size):
+        # Windows does not resize file with a mapping open
+        self._Header.close()
+        self._File.flush()
+        self._File.truncate(size)
+        self._FileSize = size
+        self._Header = mmap.mmap(self._File.fileno(), RECORDING_HEADER.size)
+
+    def _Tick(self, record):
+        window, offset = self._Map(record)
+        return RECORD_HEADER.unpack_from(window, offset)[0]
+
+    def Append(self, samples):
+        """
+        Add list of (tick, buffer) samples
+        """
+        if not self.Writable:
+            raise YAPLCRecorderError(self.path + " is opened for reading!")
+        for tick, data in samples:
+            if len(data) > self.RecordSize - RECORD_HEADER.size:
+                raise YAPLCRecorderError("sample does not fit record!")
+            if self._LastTick is not None:
+                # same wrap as last sample, or next one if tick went back
+                tick += self._LastTick - (self._LastTick & 0xffffffff)
+                if tick < self._LastTick:
+                    tick += 0x100000000
+            window, offset = self._Map(self.Count)
+            RECORD_HEADER.pack_into(window, offset, tick, len(data))
+            window[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + len(data)] = data
+            if self.Count % RECORDING_INDEX_STRIDE == 0:
+                self._Index.append(tick)
+            self._LastTick = tick
+            self.Count += 1
+        if samples:
+            RECORDING_HEADER.pack_into(self._Header, 0, RECORDING_MAGIC, RECORDING_VERSION,
+                                       self.RecordSize, len(self.Idxs), self.Count)
+
+    def Read(self, record):
+        """
+        Return (tick, buffer) of record
+        """
+        if not 0 <= record < self.Count:
+            raise IndexError("no record %d!" % record)
+        window, offset = self._Map(record)
+        tick, size = RECORD_HEADER.unpack_from(window, offset)
+        return tick, window[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + size]
+
+    def Seek(self, tick):
+        """
+        Return number of first record with tick not before given one,
+        Count if there is none
+        """
+        block = max(bisect.bisect_left(self._Index, tick) - 1, 0)
+        low = block * RECORDING_INDEX_STRIDE
+        high = min(low + 2 * RECORDING_INDEX_STRIDE, self.Count)
+        while low < high:
+            middle = (low + high) // 2
+            if self._Tick(middle) < tick:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def Samples(self, start = 0, stop = None):
+        """
+        Iterate (tick, buffer) of records with start <= tick < stop
+        """
+        record = self.Seek(start)
+        while record < self.Count:
+            tick, data = self.Read(record)
+            if stop is not None and tick >= stop:
+                break
+            yield tick, data
+            record += 1
+
+    def Close(self):
+        if self._Window is not None:
+            self._Window.close()
+            self._Window = None
+        self._WindowStart = self._WindowEnd = 0
+        if self._Header is not None:
+            self._Header.close()
+            self._Header = None
+        if self._File is not None:
+            if self.Writable:
+                # drop space grown ahead for next records
+                self._File.truncate(self.DataOffset + self.Count * self.RecordSize)
+            self._File.close()
+            self._File = None
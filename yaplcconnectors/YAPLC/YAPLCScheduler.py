@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Background scheduler of YAPLC connector jobs
+
+import sys
+import time
+import collections
+from threading import Thread, Condition, Event, currentThread
+
+# job classes, lower runs first
+SCHEDULE_COMMAND = 0
+SCHEDULE_STATUS = 1
+SCHEDULE_TRACE = 2
+SCHEDULE_LOG = 3
+
+# default rate budget of every class, jobs per second, None is unlimited
+SCHEDULE_RATES = {SCHEDULE_COMMAND: None,
+                  SCHEDULE_STATUS:  10,
+                  SCHEDULE_TRACE:   50,
+                  SCHEDULE_LOG:     50}
+
+
+class YAPLCFuture:
+    """
+    Result of a scheduled job
+    """
+    def __init__(self):
+        self._Done = Event()
+        self._Result = None
+        self._Error = None
+
+    def SetResult(self, result):
+        self._Result = result
+        self._Done.set()
+
+    def SetError(self, error):
+        # sys.exc_info() triple, raised again in Get
+        self._Error = error
+        self._Done.set()
+
+    def Done(self):
+        return self._Done.isSet()
+
+    def Get(self, timeout = None):
+        """
+        Wait for job, returns its result or None on timeout
+        """
+        if not self._Done.wait(timeout) and not self._Done.isSet():
+            return None
+        if self._Error is not None:
+            raise self._Error[0], self._Error[1], self._Error[2]
+        return self._Result
+
+
+class YAPLCScheduler:
+    """
+    Runs connector jobs on one thread by class priority.
+    Every class has a rate budget, a class that used it up waits
+    and lower classes go first meanwhile.
+    Jobs submitted with a key are coalesced while pending.
+    """
+    def __init__(self, rates = None):
+        self.Rates = dict(SCHEDULE_RATES)
+        if rates is not None:
+            self.Rates.update(rates)
+        self._Queues = dict([(cls, collections.deque()) for cls in self.Rates])
+        self._Pending = {}
+        self._NextRun = dict([(cls, 0) for cls in self.Rates])
+        self._Condition = Condition()
+        self._Running = False
+        self._Thread = None
+        # time of last Submit, tells whether anybody still uses connector
+        self.LastSubmit = time.time()
+
+    def Start(self):
+        self._Condition.acquire()
+        try:
+            if not self._Running:
+                self._Running = True
+                self._Thread = Thread(target = self._Run)
+                self._Thread.setDaemon(True)
+                self._Thread.start()
+        finally:
+            self._Condition.release()
+
+    def Stop(self):
+        """
+        Stop thread, pending jobs are run by their callers in Call
+        or left with None result
+        """
+        self._Condition.acquire()
+        try:
+            self._Running = False
+            for queue in self._Queues.values():
+                while queue:
+                    key, job, future = queue.popleft()
+                    future.SetResult(None)
+            self._Pending = {}
+            self._Condition.notifyAll()
+        finally:
+            self._Condition.release()
+
+    def Submit(self, cls, job, key = None):
+        """
+        Queue job of class cls, returns YAPLCFuture.
+        Not running scheduler runs job right away.
+        """
+        self.LastSubmit = time.time()
+        self._Condition.acquire()
+        try:
+            if self._Running:
+                if key is not None and key in self._Pending:
+                    return self._Pending[key]
+                future = YAPLCFuture()
+                self._Queues[cls].append((key, job, future))
+                if key is not None:
+                    self._Pending[key] = future
+                self._Condition.notifyAll()
+                return future
+        finally:
+            self._Condition.release()
+        future = YAPLCFuture()
+        self._Execute(job, future)
+        return future
+
+    def Call(self, cls, job, key = None):
+        """
+        Run job with scheduling and wait for its result
+        """
+        if self._Thread is currentThread():
+            # job of scheduler itself, nothing can go before it
+            return job()
+        return self.Submit(cls, job, key).Get()
+
+    def _Execute(self, job, future):
+        try:
+            future.SetResult(job())
+        except Exception:
+            future.SetError(sys.exc_info())
+
+    def _Next(self):
+        """
+        Take next job that fits its class budget, returns (job, future)
+        or time to wait for first budget to allow one
+        """
+        now = time.time()
+        wait = None
+        for cls in sorted(self._Queues):
+            queue = self._Queues[cls]
+            if not queue:
+                continue
+            if self._NextRun[cls] > now:
+                delay = self._NextRun[cls] - now
+                if wait is None or delay < wait:
+                    wait = delay
+                continue
+            key, job, future = queue.popleft()
+            if key is not None:
+                del self._Pending[key]
+            rate = self.Rates[cls]
+            if rate:
+                self._NextRun[cls] = now + 1.0 / rate
+            return job, future
+        return wait
+
+    def _Run(self):
+        while True:
+            self._Condition.acquire()
+            try:
+                while True:
+                    if not self._Running:
+                        return
+                    task = self._Next()
+                    if isinstance(task, tuple):
+                        break
+                    self._Condition.wait(task)
+            finally:
+                self._Condition.release()
+            job, future = task
+            self._Execute(job, future)
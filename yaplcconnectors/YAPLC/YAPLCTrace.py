@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Host side helpers of YAPLC trace transfer
+
+import struct
+
+from YAPLCCodec import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# tick value that acknowledges nothing, RTE answers with full sample
+NO_TICK = 0xffffffff
+
+# force value of pack plan entry not encoded yet
+_NOT_PACKED = object()
+
+
+def SplitTraceSamples(data):
+    """
+    Split GET_TRACE_SAMPLES reply, a sequence of tick, size and
+    sample buffer entries, into list of (tick, buffer).
+    Returns None if reply is truncated.
+    """
+    samples = []
+    offset = 0
+    while offset < len(data):
+        if offset + SAMPLE_HEADER.size > len(data):
+            return None
+        tick, size = SAMPLE_HEADER.unpack_from(data, offset)
+        offset += SAMPLE_HEADER.size
+        if offset + size > len(data):
+            return None
+        if size > 0:
+            samples.append((tick, str(buffer(data, offset, size))))
+        offset += size
+    return samples
+
+
+class YAPLCPackPlan:
+    """
+    SET_TRACE_VARIABLE list for fixed (idx, iectype) entries, packed into
+    one bytearray. Entry is idx, force size and force value, size 0 when
+    not forced. Only force values that changed are encoded again.
+    Types without IEC_FORCE_LAYOUTS entry are encoded by fallback
+    called with (iectype, force), which returns size byte and value.
+    """
+    def __init__(self, keys, fallback):
+        self.Keys = keys
+        self.Fallback = fallback
+        self.Layouts = [IEC_FORCE_LAYOUTS.get(iectype) for idx, iectype in keys]
+        self.Positions = dict([(idx, pos) for pos, (idx, iectype) in enumerate(keys)])
+        self.Forces = [_NOT_PACKED] * len(keys)
+        # size byte and value of every entry
+        self.Encoded = ["\0"] * len(keys)
+        self.Offsets = []
+        self.Buffer = bytearray()
+        self._Layout()
+
+    def _Encode(self, pos, force):
+        if force is None:
+            return "\0"
+        layout = self.Layouts[pos]
+        if layout is not None:
+            try:
+                return chr(layout.size) + layout.pack(force)
+            except struct.error:
+                # out of range value, fallback wraps it as C does
+                pass
+        return self.Fallback(self.Keys[pos][1], force)
+
+    def _Layout(self):
+        # entry offsets follow encoded sizes, whole buffer is written again
+        self.Offsets = []
+        offset = 0
+        for encoded in self.Encoded:
+            self.Offsets.append(offset)
+            offset += U32.size + len(encoded)
+        self.Buffer = bytearray(offset)
+        for pos, (idx, iectype) in enumerate(self.Keys):
+            offset = self.Offsets[pos]
+            U32.pack_into(self.Buffer, offset, idx)
+            encoded = self.Encoded[pos]
+            self.Buffer[offset + U32.size:offset + U32.size + len(encoded)] = encoded
+
+    def SetForces(self, forces):
+        """
+        Update force values, in place when encoded sizes stay the same
+        """
+        relayout = False
+        changed = []
+        for pos, force in enumerate(forces):
+            if force is self.Forces[pos] or \
+                    (self.Forces[pos] is not _NOT_PACKED and force == self.Forces[pos]):
+                continue
+            encoded = self._Encode(pos, force)
+            if len(encoded) != len(self.Encoded[pos]):
+                relayout = True
+            self.Forces[pos] = force
+            self.Encoded[pos] = encoded
+            changed.append(pos)
+        if relayout:
+            self._Layout()
+        else:
+            for pos in changed:
+                offset = self.Offsets[pos] + U32.size
+                encoded = self.Encoded[pos]
+                self.Buffer[offset:offset + len(encoded)] = encoded
+
+    def Entry(self, idx):
+        """
+        Return packed entry of variable idx
+        """
+        pos = self.Positions[idx]
+        return U32.pack(idx) + self.Encoded[pos]
+
+    def Data(self):
+        return str(self.Buffer)
+
+
+class YAPLCDeltaTrace:
+    """
+    Rebuilds full trace samples from GET_TRACE_DELTA replies.
+
+    Reply is tick, bitmap of changed variables (bit i of byte i / 8
+    for i-th registered variable) and values of changed variables only.
+    Request acknowledges last rebuilt tick, RTE compares against sample
+    it sent with this tick or sends everything if it has no such sample.
+    """
+    def __init__(self):
+        self.Reset([])
+
+    def Reset(self, types):
+        """
+        Start over with new list of registered variable IEC types
+        """
+        if [iectype for iectype in types if iectype not in IEC_TYPE_SIZES]:
+            # layout unknown, delta transfer can not be used
+            self.Sizes = None
+        else:
+            self.Sizes = [IEC_TYPE_SIZES[iectype] for iectype in types]
+        self.BitmapSize = (len(types) + 7) // 8
+        self.Values = None
+        self.Tick = NO_TICK
+
+    def Decode(self, data):
+        """
+        Return (tick, full trace buffer) for reply data,
+        None if reply does not fit current registration
+        """
+        count = len(self.Sizes)
+        offset = TRACE_TICK.size + self.BitmapSize
+        if len(data) < offset:
+            return self._Invalid()
+        tick, = TRACE_TICK.unpack_from(data)
+        bitmap = bytearray(buffer(data, TRACE_TICK.size, self.BitmapSize))
+        if self.Values is None:
+            values = [None] * count
+        else:
+            values = self.Values[:]
+        for idx in xrange(count):
+            if bitmap[idx >> 3] & (1 << (idx & 7)):
+                size = self.Sizes[idx]
+                if size is None:
+                    if offset >= len(data):
+                        return self._Invalid()
+                    size = 1 + U8.unpack_from(data, offset)[0]
+                values[idx] = str(buffer(data, offset, size))
+                offset += size
+        if offset != len(data) or None in values:
+            return self._Invalid()
+        self.Values = values
+        self.Tick = tick
+        return tick, "".join(values)
+
+    def _Invalid(self):
+        # forget baseline, next reply will be a full one
+        self.Values = None
+        self.Tick = NO_TICK
+        return None
+
+
+# NumPy layout of IEC types in debug buffer, see IEC_TYPE_SIZES.
+# TIME and date types are seconds and nanoseconds.
+IEC_NUMPY_TYPES = {"BOOL":  "?",   "STEP":  "u1",  "TRANSITION": "u1", "ACTION": "u1",
+                   "SINT":  "i1",  "USINT": "u1",  "BYTE":  "u1",
+                   "INT":   "<i2", "UINT":  "<u2", "WORD":  "<u2",
+                   "DINT":  "<i4", "UDINT": "<u4", "DWORD": "<u4", "REAL": "<f4",
+                   "LINT":  "<i8", "ULINT": "<u8", "LWORD": "<u8", "LREAL": "<f8",
+                   "TIME":  [("s", "<i4"), ("ns", "<i4")],
+                   "TOD":   [("s", "<i4"), ("ns", "<i4")],
+                   "DATE":  [("s", "<i4"), ("ns", "<i4")],
+                   "DT":    [("s", "<i4"), ("ns", "<i4")]}
+
+
+class YAPLCTraceColumns:
+    """
+    Sequence of per variable arrays viewing decoded records,
+    a column is only looked up when asked for
+    """
+    def __init__(self, records):
+        self.Records = records
+        self.Names = records.dtype.names or ()
+
+    def __len__(self):
+        return len(self.Names)
+
+    def __getitem__(self, idx):
+        return self.Records[self.Names[idx]]
+
+    def __iter__(self):
+        for name in self.Names:
+            yield self.Records[name]
+
+
+class YAPLCTraceDecoder:
+    """
+    Decodes trace buffers into NumPy arrays, one column per registered
+    variable. Needs NumPy and fixed size types only (no STRING).
+    """
+    def __init__(self, types = []):
+        self.Reset(types)
+
+    def Reset(self, types):
+        """
+        Build record layout for new list of registered variable IEC types
+        """
+        self.Dtype = None
+        if numpy is None or not types:
+            return
+        if [iectype for iectype in types if iectype not in IEC_NUMPY_TYPES]:
+            return
+        self.Dtype = numpy.dtype([("v%d" % idx, IEC_NUMPY_TYPES[iectype])
+                                  for idx, iectype in enumerate(types)])
+
+    def Available(self):
+        return self.Dtype is not None
+
+    def DecodeSample(self, data):
+        """
+        Return record of one trace buffer, indexed by variable position,
+        None if it does not fit registered layout
+        """
+        if self.Dtype is None or len(data) != self.Dtype.itemsize:
+            return None
+        return numpy.frombuffer(data, self.Dtype)[0]
+
+    def DecodeSamples(self, samples):
+        """
+        Return (ticks, columns) for list of (tick, buffer) samples,
+        columns is YAPLCTraceColumns, None if samples do not fit
+        registered layout
+        """
+        if self.Dtype is None:
+            return None
+        size = self.Dtype.itemsize
+        for tick, data in samples:
+            if len(data) != size:
+                return None
+        ticks = numpy.array([tick for tick, data in samples], dtype = "<u4")
+        records = numpy.frombuffer("".join([data for tick, data in samples]), self.Dtype)
+        return ticks, YAPLCTraceColumns(records)
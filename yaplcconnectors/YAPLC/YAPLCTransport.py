@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Serial transports for YAPLC connector.
+# Every transport provides the YaPySerial interface:
+# Open, Close, SetTimeout, SetMode, SupportsBaud,
+# Read, ReadInto, Write, WriteFrom, Flush, GPIO
+# and FlushTimeout, ProbeTimeout attributes expressed in its own timeout units.
+# TimeoutReopens tells SetTimeout reopens port, dropping input
+# received so far, when timeout is used.
+
+import os
+
+
+def _GetYaPySerial():
+    from YaPySerial import YaPySerial
+    return YaPySerial
+
+
+def _GetYaPyTermios():
+    from YaPyTermios import YaPyTermios
+    return YaPyTermios
+
+
+transports = {"ctypes":  _GetYaPySerial,
+              "termios": _GetYaPyTermios}
+
+# transports which need external libYaPySerial
+library_transports = ["ctypes"]
+
+
+def DefaultTransport():
+    """
+    Transport name from YAPLC_TRANSPORT environment variable,
+    native termios one on POSIX, libYaPySerial elsewhere
+    """
+    name = os.environ.get("YAPLC_TRANSPORT")
+    if name in transports:
+        return name
+    if os.name == "posix":
+        try:
+            import termios
+            return "termios"
+        except ImportError:
+            pass
+    return "ctypes"
+
+
+# libYaPySerial path found by LibraryFile, looked up once per process
+_LibraryFile = []
+
+
+def LibraryFile(name):
+    """
+    Path of libYaPySerial for transport name, None if it needs no library
+    """
+    if name not in library_transports:
+        return None
+    if not _LibraryFile:
+        _LibraryFile.append(_FindLibraryFile())
+    return _LibraryFile[0]
+
+
+def _FindLibraryFile():
+    if os.name in ("nt", "ce"):
+        lib_ext = ".dll"
+    else:
+        lib_ext = ".so"
+    libfile = os.path.dirname(os.path.realpath(__file__)) + "/../../../YaPySerial/bin/libYaPySerial" + lib_ext
+    if (os.name == 'posix' and not os.path.isfile(libfile)):
+        libfile = "libYaPySerial" + lib_ext
+    return libfile
+
+
+def TransportFactory(name, libfile):
+    """
+    Return new serial port object for transport name,
+    default transport is used when name is None
+    """
+    if name is None:
+        name = DefaultTransport()
+    return transports[name]()(libfile)
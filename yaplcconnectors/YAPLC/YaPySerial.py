@@ -8,9 +8,8 @@ import time
 
 if os.name in ("nt", "ce"):
     from _ctypes import LoadLibrary as dlopen
-    from _ctypes import FreeLibrary as dlclose
 elif os.name == "posix":
-    from _ctypes import dlopen, dlclose
+    from _ctypes import dlopen
 
 
 class YaPySerialError(exceptions.Exception):
@@ -22,41 +21,95 @@ class YaPySerialError(exceptions.Exception):
                 return "Exception in YaPySerial : " + str(self.msg)
 
 
+# bulk flush read size
+FLUSH_CHUNK = 1024
+
+
+# loaded libraries by file name, shared by all ports of the process
+_Libraries = {}
+_LibrariesLock = Lock()
+
+
+class _YaPySerialLibrary:
+    """
+    Loaded libYaPySerial with function prototypes bound
+    """
+    def __init__(self, LibFile):
+        self.Handle = dlopen(LibFile)
+        self.CDLL = ctypes.CDLL(LibFile, handle=self.Handle)
+
+        self.SerialOpen = self.CDLL.yapy_serial_open;
+        self.SerialOpen.restype = ctypes.c_int
+        self.SerialOpen.argtypes = [ctypes.POINTER( ctypes.c_void_p ), ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+
+        self.SerialClose = self.CDLL.yapy_serial_close;
+        self.SerialClose.restype = ctypes.c_int
+        self.SerialClose.argtypes = [ctypes.POINTER( ctypes.c_void_p )]
+
+        self.SerialRead = self.CDLL.yapy_serial_read;
+        self.SerialRead.restype = ctypes.c_int
+        self.SerialRead.argtypes = [ctypes.POINTER( ctypes.c_void_p ), ctypes.c_void_p, ctypes.c_size_t]
+
+        self.SerialWrite = self.CDLL.yapy_serial_write;
+        self.SerialWrite.restype = ctypes.c_int
+        self.SerialWrite.argtypes = [ctypes.POINTER( ctypes.c_void_p ), ctypes.c_void_p, ctypes.c_size_t]
+
+        self.SerialGPIO = self.CDLL.yapy_serial_gpio;
+        self.SerialGPIO.restype = ctypes.c_int
+        self.SerialGPIO.argtypes = [ctypes.POINTER( ctypes.c_void_p ), ctypes.c_int, ctypes.c_int]
+
+
+def _GetLibrary(LibFile):
+    """
+    Load library once per process, it stays loaded until exit
+    """
+    _LibrariesLock.acquire()
+    try:
+        library = _Libraries.get(LibFile)
+        if library is None:
+            library = _YaPySerialLibrary(LibFile)
+            _Libraries[LibFile] = library
+        return library
+    finally:
+        _LibrariesLock.release()
+
+
+def _GrowSize(nbytes):
+    # round buffer sizes up to a power of two, so they are not regrown often
+    size = 64
+    while size < nbytes:
+        size <<= 1
+    return size
+
+
 class YaPySerial:
+
+    # idle gap that ends input flush on open, in library timeout units
+    FlushTimeout = 1
+    # answer timeout for commands older RTE may not know
+    ProbeTimeout = 1
+    # see SetTimeout
+    TimeoutReopens = True
+
     def __init__(self, LibFile):
         self.port = None
-        self._DlibraryHandle = None
+        # per-port transfer buffers, grown on demand and reused between calls
+        self._RxBuffer = None
+        self._TxBuffer = None
+        self._OpenArgs = None
+        # timeout next read or write is done with, see SetTimeout
+        self._Timeout = None
         self.DlibraryHandle = None
         try:
-            """
-            Load library
-            """
-            self._DlibraryHandle = dlopen(LibFile)
-            self.DlibraryHandle = ctypes.CDLL(LibFile, handle=self._DlibraryHandle)
-            """
-            Attach functions
-            """
-            self._SerialOpen = self.DlibraryHandle.yapy_serial_open;
-            self._SerialOpen.restype = ctypes.c_int
-            self._SerialOpen.argtypes = [ctypes.POINTER( ctypes.c_void_p ), ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
-
-            self._SerialClose = self.DlibraryHandle.yapy_serial_close;
-            self._SerialClose.restype = ctypes.c_int
-            self._SerialClose.argtypes = [ctypes.POINTER( ctypes.c_void_p )]
-
-            self._SerialRead = self.DlibraryHandle.yapy_serial_read;
-            self._SerialRead.restype = ctypes.c_int
-            self._SerialRead.argtypes = [ctypes.POINTER( ctypes.c_void_p ), ctypes.c_void_p, ctypes.c_size_t]
-
-            self._SerialWrite = self.DlibraryHandle.yapy_serial_write;
-            self._SerialWrite.restype = ctypes.c_int
-            self._SerialWrite.argtypes = [ctypes.POINTER( ctypes.c_void_p ), ctypes.c_void_p, ctypes.c_size_t]
-
-            self._SerialGPIO = self.DlibraryHandle.yapy_serial_gpio;
-            self._SerialGPIO.restype = ctypes.c_int
-            self._SerialGPIO.argtypes = [ctypes.POINTER( ctypes.c_void_p ), ctypes.c_int, ctypes.c_int]
+            library = _GetLibrary(LibFile)
         except:
             raise YaPySerialError("Could'n t load dynamic library!")
+        self.DlibraryHandle = library.CDLL
+        self._SerialOpen = library.SerialOpen
+        self._SerialClose = library.SerialClose
+        self._SerialRead = library.SerialRead
+        self._SerialWrite = library.SerialWrite
+        self._SerialGPIO = library.SerialGPIO
 
     def Open(self, device, baud, modestr, timeout):
         self.port = ctypes.c_void_p(0)
@@ -67,6 +120,45 @@ class YaPySerial:
         if res > 0:
             msg = "Couldn't open serial port, error: " + str( res ) + "!"
             raise YaPySerialError( msg )
+        self._OpenArgs = (device, baud, modestr, timeout)
+        self._Timeout = timeout
+
+    def SetTimeout(self, timeout):
+        """
+        The library takes read timeout on open only,
+        so port is reopened on next read or write if timeout changed by then.
+        Timeout set for a probe and restored right after costs nothing.
+        Reopen drops input the OS has queued, so timeout must not change
+        while replies may be pending.
+        """
+        self._Timeout = timeout
+
+    def _ApplyTimeout(self):
+        device, baud, modestr, timeout = self._OpenArgs
+        if self._Timeout != timeout:
+            self.Close()
+            self.Open(device, baud, modestr, self._Timeout)
+
+    def SetMode(self, baud, modestr = None):
+        """
+        Change baud rate and mode string, port is reopened
+        """
+        device, old_baud, old_modestr = self._OpenArgs[:3]
+        timeout = self._Timeout
+        if modestr is None:
+            modestr = old_modestr
+        if (baud, modestr) != (old_baud, old_modestr):
+            self.Close()
+            try:
+                self.Open(device, baud, modestr, timeout)
+            except YaPySerialError:
+                # leave port open in old mode
+                self.Open(device, old_baud, old_modestr, timeout)
+                raise
+
+    def SupportsBaud(self, baud):
+        # library validates baud rate on open only
+        return True
 
     def Close(self):
         try:
@@ -78,43 +170,109 @@ class YaPySerial:
             raise YaPySerialError( msg )
         self.port = None
 
-    def Read(self, nbytes):
+    def _GetRxBuffer(self, nbytes):
+        if self._RxBuffer is None or ctypes.sizeof(self._RxBuffer) < nbytes:
+            self._RxBuffer = ctypes.create_string_buffer(_GrowSize(nbytes))
+        return self._RxBuffer
+
+    def _GetTxBuffer(self, nbytes):
+        if self._TxBuffer is None or ctypes.sizeof(self._TxBuffer) < nbytes:
+            self._TxBuffer = ctypes.create_string_buffer(_GrowSize(nbytes))
+        return self._TxBuffer
+
+    def _ReadRaw(self, ptr, nbytes):
+        self._ApplyTimeout()
         try:
-            buf = ctypes.create_string_buffer( int(nbytes) )
-            res = int(self._SerialRead( ctypes.byref( self.port ), ctypes.cast( buf, ctypes.c_void_p ), ctypes.c_size_t( nbytes ) ))
+            res = int(self._SerialRead( ctypes.byref( self.port ), ptr, ctypes.c_size_t( nbytes ) ))
         except:
             raise YaPySerialError("Runrtime error on serial read!")
         if res > 0:
             if res == 2:
-                return None
+                return False
             else:
                 msg = "Couldn't read serial port, error: " + str( res ) + "!"
                 raise YaPySerialError( msg )
-        else:
-            return buf.raw
+        return True
 
-    def Write(self, buf):
+    def _WriteRaw(self, ptr, nbytes):
+        self._ApplyTimeout()
         try:
-            nbytes = len( buf )
-            strbuf = ctypes.create_string_buffer( buf )
-            res = int(self._SerialWrite( ctypes.byref( self.port ), ctypes.cast( ctypes.byref( strbuf ), ctypes.c_void_p ), ctypes.c_size_t( nbytes ) ))
+            res = int(self._SerialWrite( ctypes.byref( self.port ), ptr, ctypes.c_size_t( nbytes ) ))
         except:
             raise YaPySerialError("Runrtime error on serial write!")
         if res > 0:
             msg = "Couldn't write to serial port, error: " + str( res ) + "!"
             raise YaPySerialError( msg )
 
-    def Flush(self):
+    def Read(self, nbytes):
+        nbytes = int(nbytes)
+        buf = self._GetRxBuffer(nbytes)
+        if self._ReadRaw(ctypes.cast( buf, ctypes.c_void_p ), nbytes):
+            return ctypes.string_at( buf, nbytes )
+        return None
+
+    def ReadInto(self, buffer, nbytes, offset = 0):
+        """
+        Read nbytes directly into a caller owned bytearray at offset.
+        Returns nbytes on success or None on timeout.
+        """
+        nbytes = int(nbytes)
+        if len(buffer) < offset + nbytes:
+            raise YaPySerialError("Read buffer is too small!")
+        if nbytes == 0:
+            return 0
+        dst = (ctypes.c_char * nbytes).from_buffer(buffer, offset)
+        if self._ReadRaw(ctypes.cast( dst, ctypes.c_void_p ), nbytes):
+            return nbytes
+        return None
+
+    def Write(self, buf):
+        # ctypes passes str contents by reference, no copy is needed
+        self._WriteRaw(ctypes.cast( ctypes.c_char_p( buf ), ctypes.c_void_p ), len( buf ))
+
+    def WriteFrom(self, buffer, nbytes = None, offset = 0):
+        """
+        Write nbytes of a bytearray, str or memoryview starting at offset.
+        bytearray and str contents are passed to the library in place,
+        memoryview contents go through the reusable transmit buffer.
+        """
+        if nbytes is None:
+            nbytes = len(buffer) - offset
+        if nbytes <= 0:
+            return
+        if isinstance(buffer, bytearray):
+            src = (ctypes.c_char * nbytes).from_buffer(buffer, offset)
+            ptr = ctypes.cast( src, ctypes.c_void_p )
+        elif isinstance(buffer, str):
+            ptr = ctypes.c_void_p( ctypes.cast( ctypes.c_char_p( buffer ), ctypes.c_void_p ).value + offset )
+        else:
+            txbuf = self._GetTxBuffer(nbytes)
+            ctypes.memmove(txbuf, buffer[offset:offset + nbytes].tobytes(), nbytes)
+            ptr = ctypes.cast( txbuf, ctypes.c_void_p )
+        self._WriteRaw(ptr, nbytes)
+
+    def Flush(self, idle = None):
+        """
+        Discard pending input.
+        Without idle, port is drained byte by byte until read times out.
+        With idle, port timeout is lowered to idle for the drain and
+        pending data is discarded in FLUSH_CHUNK sized reads,
+        first timed out read means that line was quiet for idle.
+        """
+        if idle is None:
+            buf = self._GetRxBuffer(1)
+            while self._ReadRaw(ctypes.cast( buf, ctypes.c_void_p ), 1):
+                pass
+            return
+
+        timeout = self._Timeout
+        self.SetTimeout(idle)
         try:
-            buf = ctypes.create_string_buffer(1);
-            res = 0
-            while res == 0:
-                res = int(self._SerialRead( ctypes.byref( self.port ), ctypes.cast( buf, ctypes.c_void_p ), ctypes.c_size_t(1) ))
-        except:
-            raise YaPySerialError("Runrtime error on serial flush!")
-        if res != 2:
-            msg = "Couldn't write to serial port, error: " + str( res ) + "!"
-            raise YaPySerialError( msg )
+            buf = self._GetRxBuffer(FLUSH_CHUNK)
+            while self._ReadRaw(ctypes.cast( buf, ctypes.c_void_p ), FLUSH_CHUNK):
+                pass
+        finally:
+            self.SetTimeout(timeout)
 
     def GPIO(self, n, level):
         try:
@@ -126,14 +284,13 @@ class YaPySerial:
             raise YaPySerialError( msg )
 
     def __del__(self):
-        if self._DlibraryHandle is not None:
+        # library is shared with other ports, only port is closed
+        if self.DlibraryHandle is not None:
             if self.port is not None:
                 try:
                     self.Close()
                 except:
                     raise YaPySerialError("Could'n t close serial port!")
-            dlclose(self._DlibraryHandle)
-            self._DlibraryHandle = None
             self.DlibraryHandle = None
 
 if __name__ == "__main__":
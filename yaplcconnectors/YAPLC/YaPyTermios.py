@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Native POSIX serial transport for YAPLC connector,
+# same interface as YaPySerial, without external library
+
+import exceptions
+import os
+import sys
+import errno
+import select
+import time
+
+try:
+    import termios
+    import fcntl
+    import struct
+except ImportError:
+    termios = None
+
+# bulk flush read size
+FLUSH_CHUNK = 1024
+
+# GPIO numbers accepted by YaPyTermios.GPIO
+GPIO_DTR = 0
+GPIO_RTS = 1
+
+
+class YaPyTermiosError(exceptions.Exception):
+        """Exception class"""
+        def __init__(self, msg):
+                self.msg = msg
+
+        def __str__(self):
+                return "Exception in YaPyTermios : " + str(self.msg)
+
+
+def _Mode(modestr):
+    """
+    Translate "8N1" style mode string into termios c_cflag bits
+    """
+    if len(modestr) != 3:
+        raise YaPyTermiosError("Unsupported serial mode: " + modestr + "!")
+    databits, parity, stopbits = modestr.upper()
+    cflag = {"5": termios.CS5, "6": termios.CS6,
+             "7": termios.CS7, "8": termios.CS8}.get(databits)
+    if cflag is None or parity not in "NEO" or stopbits not in "12":
+        raise YaPyTermiosError("Unsupported serial mode: " + modestr + "!")
+    if parity == "E":
+        cflag |= termios.PARENB
+    elif parity == "O":
+        cflag |= termios.PARENB | termios.PARODD
+    if stopbits == "2":
+        cflag |= termios.CSTOPB
+    return cflag
+
+
+# Linux high speed constants missing from older termios modules
+_LINUX_SPEEDS = {500000:  0010005,
+                 576000:  0010006,
+                 921600:  0010007,
+                 1000000: 0010010,
+                 1152000: 0010011,
+                 1500000: 0010012,
+                 2000000: 0010013}
+
+
+def _Speed(baud):
+    speed = getattr(termios, "B" + str(int(baud)), None)
+    if speed is None and sys.platform.startswith("linux"):
+        speed = _LINUX_SPEEDS.get(int(baud))
+    if speed is None:
+        raise YaPyTermiosError("Unsupported baud rate: " + str(baud) + "!")
+    return speed
+
+
+class YaPyTermios:
+    """
+    Serial port driven through termios and select on the file descriptor.
+    Timeouts are in seconds and may be fractional.
+    """
+
+    # idle gap that ends input flush on open
+    FlushTimeout = 0.01
+    # answer timeout for commands older RTE may not know
+    ProbeTimeout = 0.2
+    # timeout is changed in place
+    TimeoutReopens = False
+
+    def __init__(self, LibFile = None):
+        # LibFile is accepted for interface compatibility with YaPySerial
+        if termios is None:
+            raise YaPyTermiosError("termios is not available on this platform!")
+        self.port = None
+        self.timeout = None
+        # gap allowed between bytes of one read once first byte arrived,
+        # None means only overall timeout is checked
+        self.InterByteTimeout = None
+        self._OpenArgs = None
+
+    def Open(self, device, baud, modestr, timeout):
+        try:
+            fd = os.open(device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        except OSError, e:
+            raise YaPyTermiosError("Couldn't open serial port: " + str(e) + "!")
+        try:
+            self._Configure(fd, baud, modestr)
+        except:
+            os.close(fd)
+            raise
+        self.port = fd
+        self.timeout = timeout
+        self._OpenArgs = (device, baud, modestr, timeout)
+
+    def _Configure(self, fd, baud, modestr):
+        speed = _Speed(baud)
+        try:
+            attrs = termios.tcgetattr(fd)
+            # raw mode, reads never block in kernel, timeouts are done with select
+            attrs[0] = 0
+            attrs[1] = 0
+            attrs[2] = _Mode(modestr) | termios.CREAD | termios.CLOCAL
+            attrs[3] = 0
+            attrs[4] = speed
+            attrs[5] = speed
+            attrs[6][termios.VMIN] = 0
+            attrs[6][termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        except termios.error, e:
+            raise YaPyTermiosError("Couldn't configure serial port: " + str(e) + "!")
+
+    def Close(self):
+        if self.port is not None:
+            try:
+                os.close(self.port)
+            except OSError, e:
+                raise YaPyTermiosError("Couldn't close serial port: " + str(e) + "!")
+        self.port = None
+
+    def SetTimeout(self, timeout):
+        self.timeout = timeout
+
+    def SetMode(self, baud, modestr = None):
+        """
+        Change baud rate and mode string in place,
+        pending output is sent with old settings first
+        """
+        device, old_baud, old_modestr, timeout = self._OpenArgs
+        if modestr is None:
+            modestr = old_modestr
+        try:
+            termios.tcdrain(self.port)
+        except termios.error, e:
+            raise YaPyTermiosError("Couldn't drain serial port: " + str(e) + "!")
+        self._Configure(self.port, baud, modestr)
+        self._OpenArgs = (device, baud, modestr, timeout)
+
+    def SupportsBaud(self, baud):
+        try:
+            _Speed(baud)
+        except YaPyTermiosError:
+            return False
+        return True
+
+    def _WaitReadable(self, timeout):
+        try:
+            r, w, x = select.select([self.port], [], [], max(timeout, 0))
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return False
+            raise YaPyTermiosError("Runtime error on serial read: " + str(e) + "!")
+        return bool(r)
+
+    def WaitReadable(self, timeout):
+        """
+        Wait up to timeout seconds for input, returns True if some came
+        """
+        return self._WaitReadable(timeout)
+
+    def _ReadChunk(self, nbytes):
+        try:
+            return os.read(self.port, nbytes)
+        except OSError, e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return ""
+            raise YaPyTermiosError("Runtime error on serial read: " + str(e) + "!")
+
+    def _ReadLoop(self, nbytes, store):
+        """
+        Read until nbytes were passed to store or timeout expired.
+        Returns False on timeout.
+        """
+        got = 0
+        deadline = time.time() + self.timeout
+        while got < nbytes:
+            now = time.time()
+            wait = deadline - now
+            if got and self.InterByteTimeout is not None:
+                wait = min(wait, self.InterByteTimeout)
+            if wait <= 0 or not self._WaitReadable(wait):
+                if time.time() >= deadline or (got and self.InterByteTimeout is not None):
+                    return False
+                continue
+            chunk = self._ReadChunk(nbytes - got)
+            if chunk:
+                store(got, chunk)
+                got += len(chunk)
+        return True
+
+    def Read(self, nbytes):
+        nbytes = int(nbytes)
+        chunks = []
+        if self._ReadLoop(nbytes, lambda pos, chunk: chunks.append(chunk)):
+            return "".join(chunks)
+        return None
+
+    def ReadInto(self, buffer, nbytes, offset = 0):
+        """
+        Read nbytes into a caller owned bytearray at offset.
+        Returns nbytes on success or None on timeout.
+        """
+        nbytes = int(nbytes)
+        if len(buffer) < offset + nbytes:
+            raise YaPyTermiosError("Read buffer is too small!")
+
+        def store(pos, chunk):
+            buffer[offset + pos:offset + pos + len(chunk)] = chunk
+
+        if self._ReadLoop(nbytes, store):
+            return nbytes
+        return None
+
+    def ReadAvailable(self, nbytes):
+        """
+        Non blocking read, returns up to nbytes of already received data
+        """
+        return self._ReadChunk(int(nbytes))
+
+    def Write(self, buf):
+        self.WriteFrom(buf)
+
+    def WriteFrom(self, buf, nbytes = None, offset = 0):
+        if nbytes is None:
+            nbytes = len(buf) - offset
+        # memoryview slices let os.write send data in place
+        view = memoryview(buf)
+        sent = 0
+        deadline = time.time() + self.timeout
+        while sent < nbytes:
+            try:
+                sent += os.write(self.port, view[offset + sent:offset + nbytes])
+            except OSError, e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    raise YaPyTermiosError("Runtime error on serial write: " + str(e) + "!")
+                wait = deadline - time.time()
+                if wait <= 0:
+                    raise YaPyTermiosError("Serial write timeout!")
+                select.select([], [self.port], [], wait)
+
+    def Flush(self, idle = None):
+        """
+        Discard pending input, stop when line was quiet for idle seconds.
+        """
+        if idle is None:
+            idle = self.timeout
+        try:
+            termios.tcflush(self.port, termios.TCIFLUSH)
+        except termios.error, e:
+            raise YaPyTermiosError("Runtime error on serial flush: " + str(e) + "!")
+        while self._WaitReadable(idle):
+            self._ReadChunk(FLUSH_CHUNK)
+
+    def GPIO(self, n, level):
+        bits = {GPIO_DTR: termios.TIOCM_DTR, GPIO_RTS: termios.TIOCM_RTS}.get(n)
+        if bits is None:
+            raise YaPyTermiosError("Unsupported GPIO: " + str(n) + "!")
+        request = termios.TIOCMBIS if level else termios.TIOCMBIC
+        try:
+            fcntl.ioctl(self.port, request, struct.pack("I", bits))
+        except IOError, e:
+            raise YaPyTermiosError("Couldn't set serial GPIO: " + str(e) + "!")
+
+    def __del__(self):
+        if self.port is not None:
+            try:
+                self.Close()
+            except YaPyTermiosError:
+                pass
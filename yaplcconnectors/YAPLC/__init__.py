@@ -22,25 +22,81 @@
 #Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 
+import time
+from threading import Lock, Thread
+
+# open connectors by URI, reconnect of IDE takes them over
+_Connectors = {}
+_ConnectorsLock = Lock()
+_Reaper = []
+
+# IDE polls status of its connector all the time, connector not used
+# that long was dropped by IDE and is closed to free its port, s
+YAPLC_REATTACH_WINDOW = 10.0
+
+
+def _ReapConnectors():
+    while True:
+        time.sleep(YAPLC_REATTACH_WINDOW / 4)
+        _ConnectorsLock.acquire()
+        try:
+            for uri, connector in _Connectors.items():
+                if connector.SerialConnection is None or \
+                        connector.IdleTime() > YAPLC_REATTACH_WINDOW:
+                    del _Connectors[uri]
+                    connector.Disconnect()
+            if not _Connectors:
+                del _Reaper[:]
+                return
+        finally:
+            _ConnectorsLock.release()
+
+
 def YAPLC_connector_factory(uri, confnodesroot):
     """
     This returns the connector to YAPLC style PLCobject
     """
-    import os
-
     servicetype, comportstr = uri.split("://")
 
-    confnodesroot.logger.write(_("Connecting to:" + comportstr + "\n"))
+    _ConnectorsLock.acquire()
+    try:
+        connector = _Connectors.pop(uri, None)
+        if connector is not None:
+            if connector.Reattach(confnodesroot):
+                confnodesroot.logger.write(_("Reusing connection to:" + comportstr + "\n"))
+                _Connectors[uri] = connector
+                return connector
+            connector.Disconnect()
+
+        confnodesroot.logger.write(_("Connecting to:" + comportstr + "\n"))
+
+        from YAPLCObject import YAPLCObject
+        from YAPLCTransport import DefaultTransport, LibraryFile
 
-    from YAPLCObject import YAPLCObject
+        transport = DefaultTransport()
+        YaPySerialLib = LibraryFile(transport)
 
-    if os.name in ("nt", "ce"):
-        lib_ext = ".dll"
-    else:
-        lib_ext = ".so"
+        connector = YAPLCObject(YaPySerialLib,confnodesroot,comportstr,transport)
+        if connector.SerialConnection is not None:
+            _Connectors[uri] = connector
+            if not _Reaper:
+                reaper = Thread(target = _ReapConnectors)
+                reaper.setDaemon(True)
+                _Reaper.append(reaper)
+                reaper.start()
+        return connector
+    finally:
+        _ConnectorsLock.release()
 
-    YaPySerialLib = os.path.dirname(os.path.realpath(__file__)) + "/../../../YaPySerial/bin/libYaPySerial" + lib_ext
-    if (os.name == 'posix' and not os.path.isfile(YaPySerialLib)):
-        YaPySerialLib = "libYaPySerial" + lib_ext
 
-    return YAPLCObject(YaPySerialLib,confnodesroot,comportstr)
+def YAPLC_release_connectors():
+    """
+    Close all connections kept for reuse
+    """
+    _ConnectorsLock.acquire()
+    try:
+        for connector in _Connectors.values():
+            connector.Disconnect()
+        _Connectors.clear()
+    finally:
+        _ConnectorsLock.release()
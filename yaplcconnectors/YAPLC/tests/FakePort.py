@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# In-memory transport and RTE for connector unit tests.
+# Run from repository root:
+#   python -m unittest discover -s yaplcconnectors/YAPLC/tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import YAPLCTransport
+from YAPLCCodec import *
+from YAPLCFrame import *
+from YAPLCProto import *
+
+
+class FakePort:
+    """
+    Transport with the YaPySerial interface. Every write goes to Handler,
+    which returns bytes to be read back. Reads time out at once
+    when not enough input is pending.
+    """
+    FlushTimeout = 0
+    ProbeTimeout = 0
+    TimeoutReopens = False
+
+    def __init__(self, LibFile = None):
+        self.Input = bytearray()
+        self.Written = []
+        self.Timeouts = []
+        self.Handler = None
+        self.timeout = None
+        self.baud = None
+
+    def Open(self, device, baud, modestr, timeout):
+        self.baud = baud
+        self.timeout = timeout
+
+    def Close(self):
+        pass
+
+    def SetTimeout(self, timeout):
+        self.Timeouts.append(timeout)
+        self.timeout = timeout
+
+    def SetMode(self, baud, modestr = None):
+        self.baud = baud
+
+    def SupportsBaud(self, baud):
+        return True
+
+    def Read(self, nbytes):
+        if len(self.Input) < nbytes:
+            # partial input is lost with timed out read
+            del self.Input[:]
+            return None
+        data = str(self.Input[:nbytes])
+        del self.Input[:nbytes]
+        return data
+
+    def ReadInto(self, buffer, nbytes, offset = 0):
+        data = self.Read(nbytes)
+        if data is None:
+            return None
+        buffer[offset:offset + nbytes] = data
+        return nbytes
+
+    def Write(self, buf):
+        self.WriteFrom(buf)
+
+    def WriteFrom(self, buf, nbytes = None, offset = 0):
+        if nbytes is None:
+            nbytes = len(buf) - offset
+        data = str(buffer(buf, offset, nbytes))
+        self.Written.append(data)
+        if self.Handler is not None:
+            self.Input.extend(self.Handler(data))
+
+    def Flush(self, idle = None):
+        del self.Input[:]
+
+    def GPIO(self, n, level):
+        pass
+
+
+YAPLCTransport.transports["fake"] = lambda: FakePort
+
+
+class FramedRTE:
+    """
+    RTE answering CRC framed requests, handler for FakePort.
+    Commands maps command code to function of request data returning
+    reply data, None for ack only. Answers listed in Drop (by number
+    of answer, resent ones included) are lost, Corrupt ones get
+    a flipped payload bit.
+    """
+    def __init__(self, commands):
+        self.Commands = commands
+        self.Status = 0xaa
+        self.Drop = set()
+        self.Corrupt = set()
+        # commands executed, "nak" and "dup" for answers sent again
+        self.Log = []
+        # replies by seq of requests that may come again
+        self._Cache = {}
+        self._Newest = None
+        self._Pending = bytearray()
+        self._Count = 0
+
+    def __call__(self, data):
+        self._Pending.extend(data)
+        out = bytearray()
+        while self._Pending:
+            sync = self._Pending.find(FRAME_SYNC)
+            if sync < 0:
+                del self._Pending[:]
+                break
+            del self._Pending[:sync]
+            if len(self._Pending) < 1 + FRAME_HEADER.size:
+                break
+            seq, length = FRAME_HEADER.unpack_from(self._Pending, 1)
+            size = 1 + FRAME_HEADER.size + length + FRAME_CRC.size
+            if len(self._Pending) < size:
+                break
+            frame = str(self._Pending[:size])
+            del self._Pending[:size]
+            payload = frame[1 + FRAME_HEADER.size:-FRAME_CRC.size]
+            if FRAME_CRC.unpack_from(frame, size - FRAME_CRC.size)[0] != Crc16(frame[1:-FRAME_CRC.size]):
+                continue
+            out.extend(self._Answer(seq, payload))
+        return out
+
+    def _Answer(self, seq, payload):
+        if not payload or IsRepeatedSeq(seq, self._Newest):
+            self.Log.append("nak" if not payload else "dup")
+            reply = self._Cache.get(seq)
+        else:
+            command = ord(payload[0])
+            self.Log.append(command)
+            data = self.Commands[command](payload[1:])
+            reply = chr(command) + chr(self.Status)
+            if data is not None:
+                reply += LENGTH.pack(len(data)) + data
+            self._Newest = seq
+            self._Cache[seq] = reply
+            for old in self._Cache.keys():
+                if not IsRepeatedSeq(old, seq):
+                    del self._Cache[old]
+        count = self._Count
+        self._Count += 1
+        if reply is None or count in self.Drop:
+            return ""
+        frame = EncodeFrame(seq, reply)
+        if count in self.Corrupt:
+            frame[1 + FRAME_HEADER.size] ^= 1
+        return frame
+
+
+def FramedProto(rte, maxframe = 1024):
+    """
+    Connection to older RTE switched to framing by hand,
+    so handshake needs no answers
+    """
+    proto = YAPLCProto(None, "fake", 57600, 5, "fake")
+    proto.Extended = True
+    proto.Caps = YAPLCCaps(1, maxframe, 0xffffffff, [])
+    proto.Framing = True
+    proto.SerialPort.Handler = rte
+    return proto
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from FakePort import *
+from YAPLCBoot import *
+
+PAGE = 0x400
+
+
+class ReadingBootloader:
+    """
+    STM32 bootloader answering READ MEMORY from Memory, handler for FakePort
+    """
+    def __init__(self, memory):
+        self.Memory = memory
+        self.Address = None
+        self._State = "command"
+
+    def __call__(self, data):
+        data = bytearray(data)
+        if self._State == "command":
+            if data[0] != BOOT_READ or data[1] != data[0] ^ 0xff:
+                return BOOT_NACK
+            self._State = "address"
+        elif self._State == "address":
+            self.Address = (data[0] << 24) | (data[1] << 16) | (data[2] << 8) | data[3]
+            self._State = "count"
+        else:
+            self._State = "command"
+            offset = self.Address - FLASH_BASE
+            return BOOT_ACK + str(self.Memory[offset:offset + data[0] + 1])
+        return BOOT_ACK
+
+
+def Segment(page, offset, data):
+    return (FLASH_BASE + page * PAGE + offset, bytearray(data))
+
+
+class PagesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.boot = YAPLCStm32Boot(FakePort(), 5)
+        # F1 low density, 32 pages of 1 KiB
+        self.boot.ProductId = 0x412
+        self.old = [Segment(0, 0, "a" * (3 * PAGE)), Segment(5, 0x10, "b" * 0x20)]
+
+    def testPagesOf(self):
+        self.assertEqual(self.boot.PagesOf(self.old), [0, 1, 2, 5])
+        self.assertEqual(self.boot.PagesOf([Segment(0, PAGE - 1, "xy")]), [0, 1])
+
+    def testChangedPages(self):
+        new = [Segment(0, 0, "a" * PAGE + "c" + "a" * (2 * PAGE - 1)), Segment(5, 0x10, "b" * 0x20)]
+        self.assertEqual(self.boot.ChangedPages(self.old, new), [1])
+        self.assertEqual(self.boot.ChangedPages(self.old, self.old), [])
+        # data gone from a page changes it, erased bytes are 0xff
+        new = [Segment(0, 0, "a" * (3 * PAGE)), Segment(5, 0x10, "b" * 0x10)]
+        self.assertEqual(self.boot.ChangedPages(self.old, new), [5])
+        new = [Segment(0, 0, "a" * (3 * PAGE)), Segment(5, 0x10, "b" * 0x20 + "\xff")]
+        self.assertEqual(self.boot.ChangedPages(self.old, new), [])
+        # pages new image does not touch are left alone
+        self.assertEqual(self.boot.ChangedPages(self.old, self.old[:1]), [])
+
+    def testPagesSegments(self):
+        self.assertEqual(self.boot.PagesSegments(self.old, [1, 5]),
+                         [Segment(1, 0, "a" * PAGE), Segment(5, 0x10, "b" * 0x20)])
+        self.assertEqual(self.boot.PagesSegments(self.old, [3]), [])
+
+    def testMatches(self):
+        memory = bytearray("\xff" * (8 * PAGE))
+        memory[0:3 * PAGE] = "a" * (3 * PAGE)
+        self.boot.SerialPort.Handler = ReadingBootloader(memory)
+        self.assertTrue(self.boot.Matches(self.boot.PagesSegments(self.old, [0, 2])))
+        self.assertFalse(self.boot.Matches(self.boot.PagesSegments(self.old, [5])))
+        memory[5 * PAGE + 0x10:5 * PAGE + 0x30] = "b" * 0x20
+        self.assertTrue(self.boot.Matches(self.old))
+
+
+class FlashCommandTest(unittest.TestCase):
+
+    def testToolchainCommand(self):
+        # as made by toolchain_yaplc_stm32.GetBinaryCode
+        command = ["stm32flash", "-w", "plc.hex", "-v", "-g", "0x0", "-S", "0x08008000", "%(serial_port)s"]
+        # application entry is no start point, RTE boots from start of flash
+        self.assertEqual(ParseFlashCommand(command),
+                         {"image": "plc.hex", "verify": True, "go": FLASH_BASE})
+
+    def testGoAddress(self):
+        command = ["/opt/stm32flash/stm32flash", "-w", "plc.hex", "-g", "0x08004000", "/dev/ttyS0"]
+        self.assertEqual(ParseFlashCommand(command),
+                         {"image": "plc.hex", "verify": False, "go": 0x08004000})
+        self.assertEqual(ParseFlashCommand(command[:-3] + ["/dev/ttyS0"])["go"], None)
+
+    def testOtherCommands(self):
+        self.assertEqual(ParseFlashCommand(["openocd", "-w", "plc.hex"]), None)
+        self.assertEqual(ParseFlashCommand(["stm32flash", "-w", "plc.bin"]), None)
+        self.assertEqual(ParseFlashCommand(["stm32flash", "-w", "plc.hex", "-g"]), None)
+
+
+class ImageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = YAPLCImageCache(os.path.join(self.directory, "images"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def WriteHex(self, name, address, data):
+        path = os.path.join(self.directory, name)
+        records = []
+        for record, kind in [(bytearray([2, 0, 0, 4, address >> 24, (address >> 16) & 0xff]), 4),
+                             (bytearray([len(data), (address >> 8) & 0xff, address & 0xff, 0]) + data, 0),
+                             (bytearray([0, 0, 0, 1]), 1)]:
+            record.append(-sum(record) & 0xff)
+            records.append(":" + str(record).encode("hex").upper())
+        hexfile = open(path, "w")
+        hexfile.write("\n".join(records) + "\n")
+        hexfile.close()
+        return path
+
+    def testPutGet(self):
+        self.assertEqual(self.cache.Get("plc"), None)
+        self.cache.Put("plc", self.WriteHex("a.hex", FLASH_BASE + 0x10, bytearray("abc")))
+        self.assertEqual(self.cache.Get("plc"), [(FLASH_BASE + 0x10, bytearray("abc"))])
+        self.cache.Put("plc", self.WriteHex("b.hex", FLASH_BASE, bytearray("xy")))
+        self.assertEqual(self.cache.Get("plc"), [(FLASH_BASE, bytearray("xy"))])
+        self.assertEqual(self.cache.Get("other"), None)
+        # only finished images are left in cache
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+
+    def testFailedPut(self):
+        self.cache.Put("plc", self.WriteHex("a.hex", FLASH_BASE, bytearray("abc")))
+        self.cache.Put("plc", os.path.join(self.directory, "missing.hex"))
+        self.assertEqual(self.cache.Get("plc"), [(FLASH_BASE, bytearray("abc"))])
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
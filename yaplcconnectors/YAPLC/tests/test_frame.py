@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from FakePort import *
+
+
+class FrameTest(unittest.TestCase):
+
+    def testCrc(self):
+        # CRC-16/CCITT-FALSE check value
+        self.assertEqual(Crc16("123456789"), 0x29b1)
+        self.assertEqual(Crc16("56789", Crc16("1234")), 0x29b1)
+
+    def testRoundTrip(self):
+        port = FakePort()
+        port.Input.extend("\x00garbage")
+        port.Input.extend(EncodeFrame(3, "\x65\xaa"))
+        port.Input.extend(EncodeFrame(FRAME_PUSH_SEQ, ""))
+        self.assertEqual(ReadFrame(port), (3, "\x65\xaa"))
+        self.assertEqual(ReadFrame(port), (FRAME_PUSH_SEQ, ""))
+        self.assertEqual(ReadFrame(port), None)
+
+    def testBrokenFrame(self):
+        port = FakePort()
+        frame = EncodeFrame(1, "payload")
+        frame[-1] ^= 0x80
+        port.Input.extend(frame)
+        self.assertRaises(YAPLCFrameError, ReadFrame, port)
+        port.Input.extend(EncodeFrame(1, "payload")[:6])
+        self.assertRaises(YAPLCFrameError, ReadFrame, port)
+        port.Input.extend("garbage")
+        self.assertRaises(YAPLCFrameError, ReadFrame, port)
+
+    def testFrameLength(self):
+        port = FakePort()
+        port.Input.extend(EncodeFrame(1, "x" * 100))
+        try:
+            ReadFrame(port, maxlength = 64)
+            self.fail("long frame accepted")
+        except YAPLCFrameError, e:
+            # header is refused before body is waited for
+            self.assertEqual(e.msg, "bad frame length!")
+            self.assertEqual(len(port.Input), 100 + FRAME_CRC.size)
+        port.Flush()
+        port.Input.extend(EncodeFrame(1, "x" * 64))
+        self.assertEqual(ReadFrame(port, maxlength = 64), (1, "x" * 64))
+
+    def testRepeatedSeq(self):
+        self.assertFalse(IsRepeatedSeq(0, None))
+        self.assertTrue(IsRepeatedSeq(5, 5))
+        self.assertTrue(IsRepeatedSeq(FRAME_PUSH_SEQ - 1, 2))
+        self.assertFalse(IsRepeatedSeq(6, 5))
+        # same SEQ after wrap is a new request
+        self.assertFalse(IsRepeatedSeq(5, 4))
+
+
+class FramedTransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.counts = 0
+        self.rte = FramedRTE({0x6a: lambda data: None,
+                              0x66: lambda data: "plcid",
+                              0x67: self.LogCounts,
+                              0x6d: lambda data: None})
+        self.proto = FramedProto(self.rte)
+
+    def LogCounts(self, data):
+        self.counts += 1
+        return U32.pack(self.counts)
+
+    def testTransaction(self):
+        self.assertEqual(self.proto.HandleTransaction(GET_PLCIDTransaction()), ("Started", "plcid"))
+        self.assertEqual(self.proto.FrameErrors, 0)
+
+    def testLostReply(self):
+        self.rte.Drop.add(0)
+        self.assertEqual(self.proto.HandleTransaction(GET_PLCIDTransaction()), ("Started", "plcid"))
+        # request is sent again, RTE answers from its cache
+        self.assertEqual(self.rte.Log, [0x66, "dup"])
+        self.assertEqual(self.proto.FrameErrors, 1)
+        # protocol timeout is back after short retry timeout
+        self.assertEqual(self.proto.SerialPort.timeout, 5)
+
+    def testRetryKeepsReopeningTimeout(self):
+        port = self.proto.SerialPort
+        port.TimeoutReopens = True
+        del port.Timeouts[:]
+        self.rte.Drop.add(0)
+        self.assertEqual(self.proto.HandleTransaction(GET_PLCIDTransaction()), ("Started", "plcid"))
+        self.assertFalse(port.ProbeTimeout in port.Timeouts)
+
+    def testCorruptReply(self):
+        self.rte.Corrupt.add(0)
+        self.assertEqual(self.proto.HandleTransaction(GET_PLCIDTransaction()), ("Started", "plcid"))
+        self.assertEqual(self.rte.Log, [0x66, "nak"])
+
+    def testNoAnswer(self):
+        self.rte.Drop.update(range(YAPLC_FRAME_RETRIES + 1))
+        self.assertRaises(YAPLCProtoError, self.proto.HandleTransaction, IDLETransaction())
+        self.assertEqual(self.rte.Log, [0x6a] + ["dup"] * YAPLC_FRAME_RETRIES)
+
+    def testEarlyReplies(self):
+        # first reply of pipeline is lost, later ones are kept
+        self.rte.Drop.add(0)
+        transactions = [GET_PLCIDTransaction(), IDLETransaction(), SET_BAUDRATETransaction(115200)]
+        results = self.proto.HandleTransactions(transactions)
+        self.assertEqual(results, [("Started", "plcid"), ("Started", None), ("Started", None)])
+        self.assertEqual(self.rte.Log, [0x66, 0x6a, 0x6d, "dup"])
+        self.assertEqual(self.proto.FrameErrors, 1)
+
+    def testSequenceWrap(self):
+        # same request again and again, SEQ wraps more than once
+        for count in xrange(1, 3 * FRAME_PUSH_SEQ):
+            self.assertEqual(self.proto.HandleTransaction(GET_LOGCOUNTSTransaction()),
+                             ("Started", U32.pack(count)))
+        self.assertFalse("dup" in self.rte.Log)
+        # retry after wrap is still answered from cache
+        self.rte.Drop.add(len(self.rte.Log))
+        self.assertEqual(self.proto.HandleTransaction(GET_LOGCOUNTSTransaction()),
+                         ("Started", U32.pack(3 * FRAME_PUSH_SEQ)))
+        self.assertEqual(self.rte.Log[-2:], [0x67, "dup"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from FakePort import *
+from YAPLCLog import *
+
+
+def LogMessage(msgid):
+    return LOGMSG_HEADER.pack(msgid, 100 + msgid, 0) + "msg%d" % msgid
+
+
+def LogRange(data):
+    level, first, last = LOGMSG_RANGE_REQUEST.unpack(data)
+    return "".join([LENGTH.pack(len(LogMessage(msgid))) + LogMessage(msgid)
+                    for msgid in xrange(first, last)])
+
+
+class LogMessagesTest(unittest.TestCase):
+
+    def testSplit(self):
+        self.assertEqual(SplitLogMessage(LogMessage(7)), ("msg7", 7, 107, 0))
+        self.assertEqual(SplitLogMessage(LOGMSG_HEADER.pack(0, 0, 0)), None)
+        data = LogRange(LOGMSG_RANGE_REQUEST.pack(0, 3, 6))
+        self.assertEqual([message[0] for message in SplitLogMessages(data)],
+                         ["msg3", "msg4", "msg5"])
+        self.assertEqual(SplitLogMessages(data[:-1]), None)
+
+    def testRangeTransaction(self):
+        rte = FramedRTE({0x73: LogRange})
+        proto = FramedProto(rte)
+        buf = bytearray()
+        status, data = proto.HandleTransaction(
+            GET_LOGMSG_RANGETransaction(1, 10, 13).SetReplyBuffer(buf))
+        self.assertTrue(data is buf)
+        self.assertEqual([message[1] for message in SplitLogMessages(data)], [10, 11, 12])
+
+
+class LogCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = YAPLCLogCache()
+        self.cache.SetPLCID("plc")
+        self.cache.SetCounts([100, 5])
+
+    def testBackwardWindow(self):
+        # reading starts at newest message and goes back
+        self.assertEqual(self.cache.Window(0, 99), (100 - LOG_BATCH, 100))
+        self.cache.Store(0, 100 - LOG_BATCH, ["m"] * LOG_BATCH)
+        self.assertEqual(self.cache.Get(0, 99), "m")
+        self.assertEqual(self.cache.Window(0, 100 - LOG_BATCH - 1),
+                         (100 - 2 * LOG_BATCH, 100 - LOG_BATCH))
+
+    def testForwardWindow(self):
+        self.assertEqual(self.cache.Window(0, 0), (0, 1))
+        self.assertEqual(self.cache.Window(0, 1), (1, 1 + LOG_BATCH))
+        # window stops at log count
+        self.assertEqual(self.cache.Window(1, 0), (0, 1))
+        self.assertEqual(self.cache.Window(1, 2), (2, 5))
+
+    def testCachedMessagesSkipped(self):
+        # window shrinks past cached messages at its ends
+        self.cache.Store(0, 58, ["m"] * 3)
+        self.cache.Window(0, 99)
+        self.assertEqual(self.cache.Window(0, 89), (61, 90))
+        self.cache.Store(0, 38, ["m"] * 4)
+        self.cache.Window(0, 9)
+        self.assertEqual(self.cache.Window(0, 10), (10, 38))
+
+    def testReset(self):
+        self.cache.Store(0, 0, ["a", "b"])
+        self.cache.Store(1, 0, ["c"])
+        # shrinking count means logs were cleared on target
+        self.cache.SetCounts([1, 5])
+        self.assertEqual(self.cache.Get(0, 0), None)
+        self.assertEqual(self.cache.Get(1, 0), "c")
+        self.cache.SetPLCID("other")
+        self.assertEqual(self.cache.Get(1, 0), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+from FakePort import *
+import YAPLCRecorder
+from YAPLCRecorder import *
+
+
+class RecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "trace.rec")
+        # smallest window, so records spread over many mappings
+        self.window = YAPLCRecorder.RECORDING_WINDOW
+        YAPLCRecorder.RECORDING_WINDOW = mmap.ALLOCATIONGRANULARITY
+
+    def tearDown(self):
+        YAPLCRecorder.RECORDING_WINDOW = self.window
+        shutil.rmtree(self.directory)
+
+    def Record(self, samples):
+        recorder = YAPLCTraceRecorder(self.path, [(1, "INT", None), (2, "STRING", None)])
+        recorder.Append(samples)
+        recorder.Close()
+        return YAPLCTraceRecorder(self.path)
+
+    def testWindows(self):
+        samples = [(tick, U32.pack(tick) * (1 + tick % 5)) for tick in xrange(5000)]
+        reader = self.Record(samples)
+        self.assertEqual(reader.Idxs, [(1, "INT"), (2, "STRING")])
+        self.assertEqual(reader.RecordSize, RECORD_HEADER.size + 2 + IEC_STRING_MAX_SIZE)
+        self.assertEqual(reader.Count, len(samples))
+        self.assertTrue(reader.Count * reader.RecordSize > 2 * YAPLCRecorder.RECORDING_WINDOW)
+        # unused grown space is dropped on close
+        self.assertEqual(os.path.getsize(self.path), reader.DataOffset + reader.Count * reader.RecordSize)
+        self.assertEqual(list(reader.Samples()), samples)
+        # random access moves window back and forth
+        for record in (4999, 0, 2500, 1):
+            self.assertEqual(reader.Read(record), samples[record])
+        reader.Close()
+
+    def testTickWrap(self):
+        ticks = [0xfffffff0, 0xfffffffe, 0x00000002, 0x00000010, 0xfffffff0, 0x5]
+        reader = self.Record([(tick, "x") for tick in ticks])
+        extended = [tick for tick, data in reader.Samples()]
+        self.assertEqual(extended, [0xfffffff0, 0xfffffffe, 0x100000002, 0x100000010,
+                                    0x1fffffff0, 0x200000005])
+        self.assertEqual(reader.Seek(0x100000000), 2)
+        self.assertEqual([tick for tick, data in reader.Samples(0x100000002, 0x1fffffff0)],
+                         [0x100000002, 0x100000010])
+        self.assertEqual(reader.Seek(0x300000000), len(ticks))
+        reader.Close()
+
+    def testSeek(self):
+        reader = self.Record([(tick * 3, "x") for tick in xrange(3000)])
+        self.assertEqual(reader.Seek(0), 0)
+        self.assertEqual(reader.Seek(3 * 2000), 2000)
+        self.assertEqual(reader.Seek(3 * 2000 + 1), 2001)
+        reader.Close()
+
+    def testErrors(self):
+        recorder = YAPLCTraceRecorder(self.path, [(1, "INT", None)])
+        self.assertRaises(YAPLCRecorderError, recorder.Append, [(0, "too long")])
+        recorder.Close()
+        reader = YAPLCTraceRecorder(self.path)
+        self.assertEqual(reader.Count, 0)
+        self.assertRaises(IndexError, reader.Read, 0)
+        self.assertRaises(YAPLCRecorderError, reader.Append, [(0, "x")])
+        reader.Close()
+        self.assertRaises(YAPLCRecorderError, YAPLCTraceRecorder, self.path, [(1, "SOME_STRUCT", None)])
+        open(self.path, "wb").write("not a recording")
+        self.assertRaises(YAPLCRecorderError, YAPLCTraceRecorder, self.path)
+
+    def testUnfinishedRecording(self):
+        # writer still open, reader sees records counted in header only
+        recorder = YAPLCTraceRecorder(self.path, [(1, "INT", None)])
+        recorder.Append([(tick, "ab") for tick in xrange(100)])
+        reader = YAPLCTraceRecorder(self.path)
+        self.assertEqual(reader.Count, 100)
+        self.assertEqual(reader.Read(99), (99, "ab"))
+        reader.Close()
+        recorder.Close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from FakePort import *
+from YAPLCTrace import *
+
+
+class ChunkedRTE(FramedRTE):
+    """
+    Framed RTE that takes trace list in SET_TRACE_CHUNK parts
+    """
+    def __init__(self):
+        FramedRTE.__init__(self, {0x64: self.SetList, 0x75: self.SetChunk})
+        self.TraceList = None
+        self._Received = ""
+
+    def SetList(self, data):
+        self.TraceList = data[LENGTH.size:]
+
+    def SetChunk(self, data):
+        offset, total, size = CHUNK_HEADER.unpack_from(data)
+        if offset == 0:
+            # first part starts new list
+            self._Received = ""
+        if offset == len(self._Received):
+            self._Received += data[CHUNK_HEADER.size:CHUNK_HEADER.size + size]
+        if len(self._Received) == total:
+            self.TraceList = self._Received
+        return U32.pack(len(self._Received))
+
+
+def Fallback(iectype, force):
+    return chr(len(force) + 1) + chr(len(force)) + force
+
+
+class PackPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = YAPLCPackPlan([(3, "INT"), (7, "STRING"), (9, "BOOL")], Fallback)
+
+    def testLayout(self):
+        self.plan.SetForces([None, None, None])
+        self.assertEqual(self.plan.Data(), U32.pack(3) + "\0" + U32.pack(7) + "\0" + U32.pack(9) + "\0")
+        self.plan.SetForces([-2, "ab", True])
+        self.assertEqual(self.plan.Data(),
+                         U32.pack(3) + "\x02\xfe\xff" +
+                         U32.pack(7) + "\x03\x02ab" +
+                         U32.pack(9) + "\x01\x01")
+        self.assertEqual(self.plan.Entry(7), U32.pack(7) + "\x03\x02ab")
+
+    def testForcesInPlace(self):
+        self.plan.SetForces([1, None, False])
+        buf = self.plan.Buffer
+        # same encoded sizes, buffer is patched in place
+        self.plan.SetForces([2, None, True])
+        self.assertTrue(self.plan.Buffer is buf)
+        self.assertEqual(self.plan.Entry(3), U32.pack(3) + "\x02\x02\x00")
+        # size changes, entries move
+        self.plan.SetForces([2, "x", True])
+        self.assertFalse(self.plan.Buffer is buf)
+        self.assertEqual(self.plan.Data()[-13:], U32.pack(7) + "\x02\x01x" + U32.pack(9) + "\x01\x01")
+
+
+class TraceListUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rte = ChunkedRTE()
+        self.data = "".join([chr(byte & 0xff) for byte in xrange(1000)])
+
+    def testChunked(self):
+        proto = FramedProto(self.rte, 400)
+        self.assertEqual(proto.SetTraceList(self.data), ("Started", None))
+        self.assertEqual(self.rte.TraceList, self.data)
+        self.assertEqual(self.rte.Log, [0x75] * ((len(self.data) + YAPLC_CHUNK_SIZE - 1) // YAPLC_CHUNK_SIZE))
+
+    def testSmallFrames(self):
+        proto = FramedProto(self.rte, 64)
+        proto.SetTraceList(self.data)
+        self.assertEqual(self.rte.TraceList, self.data)
+        for frame in proto.SerialPort.Written:
+            self.assertTrue(len(frame) <= 64)
+
+    def testLostChunkAck(self):
+        proto = FramedProto(self.rte, 400)
+        self.rte.Drop.add(1)
+        proto.SetTraceList(self.data)
+        self.assertEqual(self.rte.TraceList, self.data)
+
+    def testWithoutChunks(self):
+        proto = FramedProto(self.rte)
+        proto.Caps = YAPLCCaps(1, 1024, 1 << (0x64 - YAPLC_CAPS_BASE), [])
+        proto.SetTraceList(self.data)
+        self.assertEqual(self.rte.Log, [0x64])
+        self.assertEqual(self.rte.TraceList, self.data)
+
+
+class DeltaTraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delta = YAPLCDeltaTrace()
+        self.delta.Reset(["BOOL", "INT", "STRING"])
+
+    def Reply(self, tick, changed, values):
+        bitmap = 0
+        for idx in changed:
+            bitmap |= 1 << idx
+        return TRACE_TICK.pack(tick) + chr(bitmap) + "".join(values)
+
+    def testDecode(self):
+        self.assertEqual(self.delta.Tick, NO_TICK)
+        full = self.Reply(10, [0, 1, 2], ["\x01", "\x05\x00", "\x02ab"])
+        self.assertEqual(self.delta.Decode(full), (10, "\x01\x05\x00\x02ab"))
+        self.assertEqual(self.delta.Tick, 10)
+        # only INT changed
+        self.assertEqual(self.delta.Decode(self.Reply(11, [1], ["\x06\x00"])),
+                         (11, "\x01\x06\x00\x02ab"))
+        # STRING changes size
+        self.assertEqual(self.delta.Decode(self.Reply(12, [2], ["\x03abc"])),
+                         (12, "\x01\x06\x00\x03abc"))
+
+    def testInvalid(self):
+        # partial reply without baseline
+        self.assertEqual(self.delta.Decode(self.Reply(10, [1], ["\x05\x00"])), None)
+        self.delta.Decode(self.Reply(10, [0, 1, 2], ["\x01", "\x05\x00", "\x00"]))
+        # trailing garbage drops baseline
+        self.assertEqual(self.delta.Decode(self.Reply(11, [0], ["\x00", "junk"])), None)
+        self.assertEqual(self.delta.Tick, NO_TICK)
+        self.assertEqual(self.delta.Decode("\x01\x00"), None)
+
+    def testUnknownType(self):
+        self.delta.Reset(["INT", "SOME_STRUCT"])
+        self.assertEqual(self.delta.Sizes, None)
+
+
+class TraceSamplesTest(unittest.TestCase):
+
+    def testSplit(self):
+        data = SAMPLE_HEADER.pack(1, 2) + "ab" + SAMPLE_HEADER.pack(2, 0) + SAMPLE_HEADER.pack(3, 1) + "c"
+        self.assertEqual(SplitTraceSamples(data), [(1, "ab"), (3, "c")])
+        self.assertEqual(SplitTraceSamples(buffer(data)), [(1, "ab"), (3, "c")])
+        self.assertEqual(SplitTraceSamples(data[:-1]), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import types
+import unittest
+
+from FakePort import *
+from YAPLCTrace import *
+from test_trace import ChunkedRTE, Fallback
+
+try:
+    from YAPLCObject import YAPLCObject
+except ImportError:
+    # Beremiz modules YAPLCObject needs are not on path
+    YAPLCObject = None
+
+
+class DeltaRTE(ChunkedRTE):
+    """
+    Chunked RTE that also takes ADD_TRACE, REMOVE_TRACE and FORCE_TRACE,
+    Changes keeps (command, data) of them
+    """
+    def __init__(self):
+        ChunkedRTE.__init__(self)
+        self.Changes = []
+        for command in (0x76, 0x77, 0x78):
+            self.Commands[command] = self.Change(command)
+
+    def Change(self, command):
+        return lambda data: self.Changes.append((command, data[LENGTH.size:]))
+
+
+def Entries(plan, idxs):
+    return "".join([plan.Entry(idx) for idx in idxs])
+
+
+@unittest.skipIf(YAPLCObject is None, "YAPLCObject needs Beremiz on path")
+class TraceListJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rte = DeltaRTE()
+        self.proto = FramedProto(self.rte)
+
+    def Job(self, old, new):
+        # trace list jobs need pack plan only, nothing is connected
+        plc = types.InstanceType(YAPLCObject)
+        plc._PackPlan = YAPLCPackPlan([(idx, iectype) for idx, iectype, force in new], Fallback)
+        plc._PackPlan.SetForces([force for idx, iectype, force in new])
+        return plc._PackPlan, plc._TraceListJob(old, new)
+
+    def testChanges(self):
+        old = [(1, "INT", None), (2, "INT", None), (3, "INT", 5)]
+        new = [(2, "INT", None), (3, "INT", 6), (4, "STRING", "ab"), (5, "BOOL", None)]
+        plan, job = self.Job(old, new)
+        self.assertEqual(job(self.proto), ("Started", None))
+        self.assertEqual(self.rte.Changes, [(0x77, U32.pack(1)),
+                                            (0x76, Entries(plan, [4, 5])),
+                                            (0x78, Entries(plan, [3]))])
+        self.assertEqual(self.rte.TraceList, None)
+
+    def testTypeChange(self):
+        # same idx with other type is another variable
+        plan, job = self.Job([(1, "INT", None), (2, "INT", None)],
+                             [(1, "DINT", None), (2, "INT", 7)])
+        job(self.proto)
+        self.assertEqual(self.rte.Changes, [(0x77, U32.pack(1)),
+                                            (0x76, Entries(plan, [1])),
+                                            (0x78, Entries(plan, [2]))])
+
+    def testFullUpload(self):
+        new = [(1, "INT", None), (2, "INT", 3)]
+        # RTE list unknown, emptied or maybe lost
+        for old in (None, [], new):
+            self.rte.TraceList = None
+            plan, job = self.Job(old, new)
+            self.assertEqual(job(self.proto), ("Started", None))
+            self.assertEqual(self.rte.TraceList, str(plan.Data()))
+        plan, job = self.Job(new, [])
+        job(self.proto)
+        self.assertEqual(self.rte.TraceList, "")
+        self.assertEqual(self.rte.Changes, [])
+
+    def testUnsupported(self):
+        self.proto.Caps = YAPLCCaps(1, 1024, 0xffffffff & ~(1 << (0x77 - YAPLC_CAPS_BASE)), [])
+        plan, job = self.Job([(1, "INT", None), (2, "INT", None)], [(2, "INT", None)])
+        job(self.proto)
+        self.assertEqual(self.rte.Changes, [])
+        self.assertEqual(self.rte.TraceList, str(plan.Data()))
+
+    def testTooLarge(self):
+        self.proto = FramedProto(self.rte, 64)
+        new = [(idx, "LINT", idx) for idx in xrange(10)]
+        plan, job = self.Job(new[:1], new)
+        job(self.proto)
+        self.assertEqual(self.rte.Changes, [])
+        self.assertEqual(self.rte.TraceList, str(plan.Data()))
+
+
+if __name__ == "__main__":
+    unittest.main()
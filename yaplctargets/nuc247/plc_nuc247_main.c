@@ -144,6 +144,25 @@ extern void suspendDebug(int disable);
 extern void FreeDebugData(void);
 extern int GetDebugData(unsigned long *tick, unsigned long *size, void **buffer);
 
+/* Debug sample ring: PLC_DEBUG_RING_SIZE samples of up to PLC_DEBUG_RING_SAMPLE bytes
+ * are kept between debugger polls, bigger samples wait in debug buffer as before.
+ * RTE drains ring through dbg_data_get/dbg_data_free, oldest sample first,
+ * so only RTE that fetches every pending sample (GET_TRACE_SAMPLES) may
+ * enable it. Older RTE fetch one sample per poll and need latest one,
+ * so ring is off (0) unless build asks for it. */
+#ifndef PLC_DEBUG_RING_SIZE
+#define PLC_DEBUG_RING_SIZE 0
+#endif
+
+#ifndef PLC_DEBUG_RING_SAMPLE
+#define PLC_DEBUG_RING_SAMPLE 64
+#endif
+
+#if PLC_DEBUG_RING_SIZE > 0
+int GetDebugSample(unsigned long *tick, unsigned long *size, void **buffer);
+void FreeDebugSample(void);
+#endif
+
 extern void ResetDebugVariables(void);
 extern void RegisterDebugVariable(int idx, void* force);
 
@@ -196,8 +215,13 @@ __attribute__ ((section(".plc_app_abi_sec"))) plc_app_abi_t plc_yaplc_app =
     .dbg_resume    = resumeDebug,
     .dbg_suspend   = suspendDebug,
 
+#if PLC_DEBUG_RING_SIZE > 0
+    .dbg_data_get  = GetDebugSample,
+    .dbg_data_free = FreeDebugSample,
+#else
     .dbg_data_get  = GetDebugData,
     .dbg_data_free = FreeDebugData,
+#endif
 
     .dbg_vars_reset   = ResetDebugVariables,
     .dbg_var_register = RegisterDebugVariable,
@@ -264,11 +288,86 @@ void LeaveDebugSection(void)
         debug_locked = 0;
 }
 
+#if PLC_DEBUG_RING_SIZE > 0
+typedef struct
+{
+    unsigned long tick;
+    unsigned long size;
+    uint8_t data[PLC_DEBUG_RING_SAMPLE];
+} plc_debug_sample_t;
+
+static plc_debug_sample_t debug_ring[PLC_DEBUG_RING_SIZE];
+static unsigned int debug_ring_head  = 0; /* next slot to fill */
+static unsigned int debug_ring_count = 0;
+static int debug_ring_taken = 0;          /* oldest sample is being sent */
+
+/* Move published debug buffer to ring, so PLC can publish next cycle */
+static void DebugRingCapture(void)
+{
+    unsigned long tick, size;
+    void * buffer;
+    int locked;
+    plc_debug_sample_t * sample;
+
+    if(debug_ring_count >= PLC_DEBUG_RING_SIZE){
+        /* ring is full, sample waits in debug buffer */
+        return;
+    }
+    locked = debug_locked;
+    debug_locked = 0;
+    if(GetDebugData(&tick, &size, &buffer) == 0){
+        if(size <= PLC_DEBUG_RING_SAMPLE){
+            sample = &debug_ring[debug_ring_head];
+            sample->tick = tick;
+            sample->size = size;
+            memcpy(sample->data, buffer, size);
+            debug_ring_head = (debug_ring_head + 1) % PLC_DEBUG_RING_SIZE;
+            debug_ring_count++;
+            FreeDebugData();
+        }else{
+            /* too big for ring slot, keep it in debug buffer */
+            _DebugDataAvailable = 1;
+        }
+    }
+    debug_locked = locked;
+}
+
+/* Oldest pending sample, ring first, then debug buffer; returns 0 on success */
+int GetDebugSample(unsigned long *tick, unsigned long *size, void **buffer)
+{
+    plc_debug_sample_t * sample;
+
+    if(debug_ring_count > 0){
+        sample = &debug_ring[(debug_ring_head + PLC_DEBUG_RING_SIZE - debug_ring_count) % PLC_DEBUG_RING_SIZE];
+        *tick   = sample->tick;
+        *size   = sample->size;
+        *buffer = sample->data;
+        debug_ring_taken = 1;
+        return 0;
+    }
+    debug_ring_taken = 0;
+    return GetDebugData(tick, size, buffer);
+}
+
+void FreeDebugSample(void)
+{
+    if(debug_ring_taken){
+        debug_ring_count--;
+        debug_ring_taken = 0;
+    }else{
+        FreeDebugData();
+    }
+}
+#endif
+
 void InitiateDebugTransfer(void)
 {
     /* remember tick */
     __debug_tick = __tick;
     _DebugDataAvailable = 1;
+#if PLC_DEBUG_RING_SIZE > 0
+    DebugRingCapture();
+#endif
 }
 
 void suspendDebug(int disable)
@@ -276,6 +375,11 @@ void suspendDebug(int disable)
     /* Prevent PLC to enter debug code */
     __DEBUG = !disable;
     debug_locked = !disable;
+#if PLC_DEBUG_RING_SIZE > 0
+    /* samples of previous variable list are useless */
+    debug_ring_count = 0;
+    debug_ring_taken = 0;
+#endif
 }
 
 void resumeDebug(void)